@@ -0,0 +1,194 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+from recipes.models import Tag
+
+VERSION_KEY = 'version:{}'
+
+DATA_KEY = 'data:{}:{}'
+
+RESPONSE_KEY = 'response:{}:{}:{}'
+
+LOCK_KEY = 'lock:{}'
+
+TAGS_NAMESPACE = 'tags'
+
+RECIPES_NAMESPACE = 'recipes'
+
+# Блокировка построения значения (секунды): время жизни блокировки,
+# максимальное ожидание чужого результата и интервал проверки.
+LOCK_TIMEOUT = 10
+
+LOCK_WAIT = 2
+
+LOCK_POLL_INTERVAL = 0.05
+
+# Пространства имён, версия которых сменится после фиксации транзакции.
+_pending = threading.local()
+
+
+def get_version(namespace):
+    """
+    Текущая версия пространства имён кэша.
+    Ключи с данными включают версию, поэтому смена версии
+    делает все ранее сохранённые значения недоступными.
+    """
+
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace):
+    """Инвалидация всех значений пространства имён."""
+
+    key = VERSION_KEY.format(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
+        return cache.get(key, 2)
+
+
+def _pending_namespaces():
+    if not hasattr(_pending, 'namespaces'):
+        _pending.namespaces = set()
+    return _pending.namespaces
+
+
+def _bump_pending(namespace):
+    pending = _pending_namespaces()
+    if namespace in pending:
+        pending.discard(namespace)
+        bump_version(namespace)
+
+
+def bump_version_on_commit(namespace):
+    """
+    Инвалидация пространства имён после фиксации текущей транзакции,
+    чтобы параллельный запрос не закэшировал старые данные.
+    В одной транзакции версия меняется один раз: ожидающие фиксации
+    пространства имён хранятся в множестве потока, первый сработавший
+    обработчик on_commit меняет версию и убирает имя из множества,
+    остальные ничего не делают. Обработчик регистрируется при каждом
+    вызове, поэтому откат транзакции или точки сохранения, отбросивший
+    ранее зарегистрированные обработчики, версию не теряет.
+    """
+
+    _pending_namespaces().add(namespace)
+    transaction.on_commit(functools.partial(_bump_pending, namespace))
+
+
+def get_or_build_locked(key, build, timeout=None):
+    """
+    Значение по ключу с защитой от одновременного построения
+    (cache stampede): при промахе значение строит запрос, получивший
+    блокировку, остальные ждут его результата не дольше LOCK_WAIT секунд
+    и только потом строят значение сами.
+    """
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock = LOCK_KEY.format(key)
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock)
+        return value
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline and cache.get(lock) is not None:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return build()
+
+
+def get_or_build(namespace, build, timeout=None):
+    """
+    Значение пространства имён для текущей версии.
+    При промахе значение вычисляется функцией build() и сохраняется.
+    """
+
+    return get_or_build_locked(
+        DATA_KEY.format(namespace, get_version(namespace)), build, timeout
+    )
+
+
+def request_key(request):
+    """
+    Ключ запроса: адрес без параметров и параметры запроса,
+    отсортированные по имени и значению, так что порядок параметров
+    (например, нескольких tags) не создаёт отдельных записей.
+    """
+
+    params = sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists()
+    )
+    content = json.dumps(
+        [request.build_absolute_uri(request.path), params],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def get_response_data(namespace, request, build, timeout=None):
+    """
+    Данные ответа на запрос для текущей версии пространства имён.
+    При промахе данные формирует функция build().
+    """
+
+    key = RESPONSE_KEY.format(
+        namespace, get_version(namespace), request_key(request)
+    )
+    return get_or_build_locked(key, build, timeout)
+
+
+def make_etag(data):
+    """Сильный ETag по содержимому ответа."""
+
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return quote_etag(hashlib.sha1(content.encode()).hexdigest())
+
+
+def build_tags():
+    from .serializers import TagSerializer
+
+    tags = [
+        dict(tag) for tag in
+        TagSerializer(Tag.objects.order_by('id'), many=True).data
+    ]
+    by_id = {str(tag['id']): tag for tag in tags}
+    return {
+        'list': tags,
+        'etag': make_etag(tags),
+        'by_id': by_id,
+        'etags': {pk: make_etag(tag) for pk, tag in by_id.items()},
+        'last_modified': int(time.time()),
+    }
+
+
+def get_tags():
+    """
+    Сериализованные теги из версионного кэша вместе с ETag
+    списка и каждого тега и временем формирования (Last-Modified).
+    Версия меняется при сохранении и удалении тегов.
+    """
+
+    return get_or_build(
+        TAGS_NAMESPACE, build_tags, settings.TAG_CACHE_TIMEOUT
+    )
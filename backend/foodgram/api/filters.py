@@ -1,52 +1,120 @@
+from django.db import connections
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe, Tag
+from recipes import search
+from recipes.models import (FavoriteRecipe, Recipe, RecipeTag,
+                            ShoppingCartRecipe)
+from rest_framework.filters import SearchFilter
+
+from .cache import get_tags
+
+
+class RecipeSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск рецептов по параметру search: название,
+    описание и ингредиенты, результаты упорядочены по релевантности.
+    Если СУБД не поддерживает поиск, используется SearchFilter
+    по полям search_fields вьюсета.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query or not search.supported(connections[queryset.db]):
+            return super().filter_queryset(request, queryset, view)
+        return search.search(queryset, query)
+
+
+# Сортировки рецептов по параметру ordering, по умолчанию - новые первыми.
+DEFAULT_RECIPE_ORDERING = ('-pub_date', 'id')
+
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-pub_date', 'id'),
+}
+
+
+def tag_choices():
+    """Варианты фильтра по тегам из кэша тегов."""
+
+    return [(tag['slug'], tag['slug']) for tag in get_tags()['list']]
 
 
 class RecipeFilter(FilterSet):
+    """
+    Фильтры рецептов. Условия по тегам, избранному и корзине
+    проверяются подзапросами EXISTS и IN без соединений,
+    поэтому рецепты не дублируются и DISTINCT не нужен.
+    """
 
-    is_favorited = filters.BooleanFilter(
-        field_name='favorited_by',
-        method='filter_is_favorited'
-    )
+    is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
-        field_name='in_shopping_cart_of',
         method='filter_is_in_shopping_cart'
     )
     tags = filters.MultipleChoiceFilter(
-        field_name='tags__slug',
-        choices=Tag.objects.values_list('slug', 'slug')
+        choices=tag_choices,
+        method='filter_tags'
     )
     author = filters.NumberFilter(
-        field_name='author__id'
+        field_name='author_id'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering'
     )
 
     class Meta:
         model = Recipe
         fields = [
-            'favorited_by',
-            'in_shopping_cart_of',
+            'is_favorited',
+            'is_in_shopping_cart',
             'tags',
-            'author'
+            'author',
+            'ordering'
         ]
 
-    def filter_is_favorited(self, qs, name, value):
+    def filter_tags(self, qs, name, value):
+        """Рецепты, у которых есть хотя бы один из выбранных тегов."""
+
+        tag_ids = [
+            tag['id'] for tag in get_tags()['list'] if tag['slug'] in value
+        ]
+        return qs.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=tag_ids
+        )))
+
+    def filter_by_user(self, qs, model, value):
         """
-        Фильтрация в зависимости от значения поля модели Recipe:
-        favorited_by.
+        Фильтрация по наличию записи связи (model) рецепта
+        с текущим пользователем: IN (подзапрос) или NOT EXISTS.
+        У анонимного пользователя связей нет.
         """
 
-        return (
-            qs.filter(favorited_by=self.request.user.id) if value
-            else qs.exclude(favorited_by=self.request.user.id)
-        )
+        user = self.request.user
+        if user.is_anonymous:
+            return qs.none() if value else qs
+        if value:
+            return qs.filter(pk__in=model.objects.filter(
+                user=user
+            ).values('recipe_id'))
+        return qs.filter(~Exists(model.objects.filter(
+            user=user,
+            recipe=OuterRef('pk')
+        )))
+
+    def filter_is_favorited(self, qs, name, value):
+        """Фильтрация по наличию рецепта в избранном пользователя."""
+
+        return self.filter_by_user(qs, FavoriteRecipe, value)
 
     def filter_is_in_shopping_cart(self, qs, name, value):
+        """Фильтрация по наличию рецепта в корзине пользователя."""
+
+        return self.filter_by_user(qs, ShoppingCartRecipe, value)
+
+    def filter_ordering(self, qs, name, value):
         """
-        Фильтрация в зависимости от значения поля модели Recipe:
-        in_shopping_cart_of.
+        Сортировка рецептов: popular - по количеству добавлений
+        в избранное (индекс recipe_popular_idx).
         """
 
-        return (
-            qs.filter(in_shopping_cart_of=self.request.user.id) if value
-            else qs.exclude(in_shopping_cart_of=self.request.user.id)
-        )
+        return qs.order_by(*RECIPE_ORDERINGS[value])
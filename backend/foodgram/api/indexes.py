@@ -0,0 +1,91 @@
+import bisect
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+from .cache import get_version
+
+INGREDIENTS_NAMESPACE = 'ingredients'
+
+SEARCH_LIMIT = 30
+
+MAX_SEARCH_LIMIT = 100
+
+
+class IngredientPrefixIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Названия хранятся отсортированными в нижнем регистре (casefold),
+    поиск по началу названия выполняется двоичным поиском.
+    Индекс перестраивается при смене версии в кэше (изменение
+    ингредиентов) или по истечении INGREDIENT_INDEX_TIMEOUT секунд.
+    Ключи, строки и словарь по id публикуются одним присваиванием
+    кортежа, поэтому читатели без блокировки видят согласованный индекс.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = None
+        self._data = ([], [], {})
+
+    def build(self):
+        rows = Ingredient.objects.order_by().values(
+            'id', 'name', 'measurement_unit'
+        )
+        entries = sorted(
+            (row['name'].casefold(), row['id'], row) for row in rows
+        )
+        items = [row for _, _, row in entries]
+        self._data = (
+            [key for key, _, _ in entries],
+            items,
+            {row['id']: row for row in items}
+        )
+        self._built_at = time.monotonic()
+
+    def refresh(self):
+        """Перестроение индекса, если он устарел."""
+
+        version = get_version(INGREDIENTS_NAMESPACE)
+        expired = (
+            self._built_at is None
+            or time.monotonic() - self._built_at
+            > settings.INGREDIENT_INDEX_TIMEOUT
+        )
+        if version == self._version and not expired:
+            return
+        with self._lock:
+            if version != self._version or expired:
+                self.build()
+                self._version = version
+
+    def search(self, prefix, limit=SEARCH_LIMIT):
+        """
+        Ингредиенты, название которых начинается с prefix.
+        Сначала точное совпадение, затем более короткие названия.
+        """
+
+        self.refresh()
+        keys, items, _ = self._data
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(keys, prefix)
+        if not prefix:
+            return items[start:start + limit]
+        end = bisect.bisect_left(keys, prefix + '\U0010ffff', start)
+        positions = heapq.nsmallest(
+            limit,
+            range(start, end),
+            key=lambda position: (len(keys[position]), keys[position])
+        )
+        return [items[position] for position in positions]
+
+    def get(self, pk):
+        self.refresh()
+        return self._data[2].get(pk)
+
+
+ingredient_index = IngredientPrefixIndex()
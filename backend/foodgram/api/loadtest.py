@@ -0,0 +1,332 @@
+"""
+Нагрузочное тестирование API без внешних сервисов.
+
+Виртуальные пользователи (потоки) выполняют сценарии, выбранные
+случайно по весам смеси трафика: просмотр ленты, фильтр по тегам,
+страница рецепта, добавление и удаление из избранного, скачивание
+списка покупок. Шаги сценариев - операции docs/openapi-schema.yml:
+схема определяет, существует ли операция, нужна ли для неё
+авторизация и какие параметры запроса она принимает.
+
+Запросы выполняются в процессе (django.test.Client) или по HTTP
+к запущенному серверу (например, gunicorn). Результат - пропускная
+способность и перцентили времени ответа p50/p95/p99 по эндпоинтам.
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.test import Client
+
+# Сценарии: шаги (метод, путь из схемы, параметры запроса).
+# Значения параметров и {id} подставляет Sampler.
+FLOWS = {
+    'browse': (('get', '/api/recipes/', ('page', )), ),
+    'tags': (('get', '/api/recipes/', ('tags', )), ),
+    'recipe': (('get', '/api/recipes/{id}/', ()), ),
+    'favorite': (
+        ('post', '/api/recipes/{id}/favorite/', ()),
+        ('delete', '/api/recipes/{id}/favorite/', ()),
+    ),
+    'cart': (('get', '/api/recipes/download_shopping_cart/', ()), ),
+}
+
+DEFAULT_MIX = 'browse=40,tags=20,recipe=30,favorite=7,cart=3'
+
+PERCENTILES = (50, 95, 99)
+
+
+class LoadTestError(ValueError):
+    """Сценарии не соответствуют схеме или неверно заданы."""
+
+
+def parse_mix(value):
+    """Смесь трафика 'сценарий=вес,...' как словарь {сценарий: вес}."""
+
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise LoadTestError(
+                f'Неизвестный сценарий {name!r}, доступны: '
+                f'{", ".join(FLOWS)}.'
+            )
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise LoadTestError(f'Неверный вес сценария {name!r}.')
+    if not any(weight > 0 for weight in mix.values()):
+        raise LoadTestError('Сумма весов сценариев должна быть больше 0.')
+    return mix
+
+
+class Step:
+    """Шаг сценария - операция схемы OpenAPI."""
+
+    def __init__(self, schema, method, path, params):
+        operation = schema.get('paths', {}).get(path, {}).get(method)
+        if operation is None:
+            raise LoadTestError(
+                f'В схеме нет операции {method.upper()} {path}.'
+            )
+        allowed = {
+            parameter['name']
+            for parameter in operation.get('parameters', ())
+            if parameter.get('in') == 'query'
+        }
+        unknown = set(params) - allowed
+        if unknown:
+            raise LoadTestError(
+                f'{method.upper()} {path}: в схеме нет параметров '
+                f'{", ".join(sorted(unknown))}.'
+            )
+        self.method = method
+        self.path = path
+        self.params = params
+        self.name = f'{method.upper()} {path}'
+        self.operation = operation.get('operationId', '')
+        self.auth = bool(operation.get('security'))
+
+
+def build_flows(schema, mix):
+    """Сценарии смеси mix: {сценарий: (вес, шаги, нужна авторизация)}."""
+
+    flows = {}
+    for name, weight in mix.items():
+        steps = tuple(Step(schema, *step) for step in FLOWS[name])
+        flows[name] = (weight, steps, any(step.auth for step in steps))
+    return flows
+
+
+class Sampler:
+    """
+    Значения параметров: популярные рецепты открываются чаще
+    (веса Ципфа по рейтингу избранного), страницы ленты - чаще первые.
+    """
+
+    def __init__(self, recipe_ids, tag_slugs, pages):
+        from recipes.generator import zipf_weights
+
+        if not recipe_ids or not tag_slugs:
+            raise LoadTestError('В базе нет рецептов или тегов.')
+        self.recipe_ids = recipe_ids
+        self.recipe_weights = zipf_weights(len(recipe_ids))
+        self.tag_slugs = tag_slugs
+        self.pages = list(range(1, pages + 1))
+        self.page_weights = zipf_weights(pages)
+
+    def recipe(self, rnd):
+        return rnd.choices(
+            self.recipe_ids, cum_weights=self.recipe_weights
+        )[0]
+
+    def query(self, rnd, params):
+        query = {}
+        if 'page' in params:
+            query['page'] = rnd.choices(
+                self.pages, cum_weights=self.page_weights
+            )[0]
+        if 'tags' in params:
+            query['tags'] = rnd.sample(
+                self.tag_slugs, rnd.randint(1, min(2, len(self.tag_slugs)))
+            )
+        return query
+
+
+class InProcessTransport:
+    """
+    Запросы через django.test.Client в потоке виртуального пользователя.
+    Исключения сервера не пробрасываются: ответ учитывается со статусом
+    500, как при запросе по HTTP.
+    """
+
+    def __init__(self, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        self.client = Client(raise_request_exception=False, **headers)
+
+    def request(self, method, path, query):
+        if method == 'get':
+            response = self.client.get(path, query)
+        else:
+            response = getattr(self.client, method)(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """
+    Запросы по HTTP к серверу base_url (requests.Session).
+    Ошибка соединения учитывается как ответ со статусом 0.
+    """
+
+    def __init__(self, base_url, token=None):
+        import requests
+
+        self.errors = requests.RequestException
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Token {token}'
+
+    def request(self, method, path, query):
+        try:
+            return self.session.request(
+                method, self.base_url + path, params=query or None
+            ).status_code
+        except self.errors:
+            return 0
+
+    def close(self):
+        self.session.close()
+
+
+def percentile(values, rank):
+    """Перцентиль rank отсортированного списка (метод ближайшего ранга)."""
+
+    return values[max(0, math.ceil(rank / 100 * len(values)) - 1)]
+
+
+class LoadTest:
+    """
+    Запуск concurrency виртуальных пользователей на duration секунд
+    или до requests запросов. tokens - токены авторизованных
+    виртуальных пользователей (по кругу), None - анонимный.
+    """
+
+    def __init__(self, flows, sampler, transport, tokens, concurrency=10,
+                 duration=30, requests=None, anonymous=0.0, seed=0):
+        self.flows = flows
+        self.sampler = sampler
+        self.transport = transport
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.anonymous = anonymous
+        self.seed = seed
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def take_request(self):
+        """Резервирование запроса из общего лимита."""
+
+        with self.lock:
+            if self.requests is not None and self.sent >= self.requests:
+                return False
+            self.sent += 1
+            return True
+
+    def user_flows(self, token):
+        names, weights = [], []
+        for name, (weight, steps, auth) in self.flows.items():
+            if weight > 0 and (token or not auth):
+                names.append(name)
+                weights.append(weight)
+        return names, weights
+
+    def run_user(self, index, deadline):
+        """
+        Виртуальный пользователь. Исключение транспорта учитывается
+        как ответ со статусом 0 (ошибка), и пользователь продолжает.
+        """
+
+        rnd = random.Random(self.seed + index)
+        anonymous = not self.tokens or rnd.random() < self.anonymous
+        token = None if anonymous else self.tokens[index % len(self.tokens)]
+        names, weights = self.user_flows(token)
+        if not names:
+            return
+        transport = self.transport(token)
+        samples = defaultdict(list)
+        try:
+            while time.monotonic() < deadline:
+                _, steps, _ = self.flows[
+                    rnd.choices(names, weights=weights)[0]
+                ]
+                recipe_id = self.sampler.recipe(rnd)
+                for step in steps:
+                    if not self.take_request():
+                        return
+                    path = step.path.replace('{id}', str(recipe_id))
+                    query = self.sampler.query(rnd, step.params)
+                    started = time.perf_counter()
+                    try:
+                        status = transport.request(step.method, path, query)
+                    except Exception:
+                        # Сбой одного запроса не завершает пользователя.
+                        status = 0
+                    samples[step.name].append(
+                        (time.perf_counter() - started, status)
+                    )
+        finally:
+            transport.close()
+            with self.lock:
+                for name, values in samples.items():
+                    self.samples[name].extend(values)
+
+    def run(self):
+        deadline = time.monotonic() + (
+            self.duration if self.duration else math.inf
+        )
+        started = time.monotonic()
+        threads = [
+            threading.Thread(
+                target=self.run_user, args=(index, deadline),
+                name=f'loadtest-{index}'
+            ) for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.monotonic() - started)
+
+    def report(self, elapsed):
+        operations = {
+            step.name: step.operation
+            for _, steps, _ in self.flows.values() for step in steps
+        }
+        endpoints = {}
+        total = errors = 0
+        for name, values in sorted(self.samples.items()):
+            latencies = sorted(latency for latency, _ in values)
+            failed = sum(
+                not 200 <= status < 400 for _, status in values
+            )
+            statuses = defaultdict(int)
+            for _, status in values:
+                statuses[str(status)] += 1
+            endpoints[name] = {
+                'operation': operations[name],
+                'requests': len(values),
+                'errors': failed,
+                'statuses': dict(statuses),
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                **{
+                    f'p{rank}_ms': round(
+                        percentile(latencies, rank) * 1000, 2
+                    )
+                    for rank in PERCENTILES
+                },
+            }
+            total += len(values)
+            errors += failed
+        return {
+            'concurrency': self.concurrency,
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+            'endpoints': endpoints,
+        }
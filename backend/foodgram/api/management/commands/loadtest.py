@@ -0,0 +1,142 @@
+import functools
+import json
+import math
+import os
+
+from api import loadtest
+from api.pagination import RECIPES_PER_PAGE
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from recipes.models import Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+SCHEMA_FILE = os.path.join(
+    settings.BASE_DIR, '..', '..', 'docs', 'openapi-schema.yml'
+)
+
+# Рецепты, которые открывают виртуальные пользователи:
+# самые популярные, популярность внутри выборки - по Ципфу.
+POPULAR_RECIPES = 1000
+
+MAX_PAGES = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочное тестирование API: сценарии из docs/openapi-schema.yml '
+        'по смеси трафика, в процессе или по HTTP (--url). Выводит '
+        'пропускную способность и p50/p95/p99 по эндпоинтам в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help=(
+                'Адрес запущенного сервера, например http://127.0.0.1:8000. '
+                'Без него запросы выполняются в процессе.'
+            )
+        )
+        parser.add_argument('--schema', default=SCHEMA_FILE)
+        parser.add_argument(
+            '--mix', default=loadtest.DEFAULT_MIX,
+            help=(
+                'Веса сценариев: '
+                f'{", ".join(loadtest.FLOWS)} (по умолчанию '
+                f'{loadtest.DEFAULT_MIX}).'
+            )
+        )
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность в секундах (0 - до --requests запросов).'
+        )
+        parser.add_argument(
+            '--requests', type=int, help='Общее количество запросов.'
+        )
+        parser.add_argument(
+            '--users', type=int, default=50,
+            help='Сколько пользователей базы авторизуются в тесте.'
+        )
+        parser.add_argument(
+            '--anonymous', type=float, default=0.2,
+            help='Доля анонимных виртуальных пользователей.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для отчёта в JSON.')
+
+    def load_schema(self, path):
+        try:
+            import yaml
+        except ImportError:
+            raise CommandError('Для чтения схемы нужен пакет PyYAML.')
+        if not os.path.isfile(path):
+            raise CommandError(
+                f'Файл схемы {path} не найден (каталог docs/ не входит '
+                'в образ backend). Укажите путь к openapi-schema.yml '
+                'параметром --schema.'
+            )
+        try:
+            with open(path, encoding='utf-8') as file:
+                return yaml.safe_load(file)
+        except (OSError, yaml.YAMLError) as error:
+            raise CommandError(f'Не удалось прочитать схему: {error}')
+
+    def tokens(self, count):
+        users = User.objects.filter(is_active=True).order_by('id')[:count]
+        return [
+            Token.objects.get_or_create(user=user)[0].key for user in users
+        ]
+
+    def sampler(self):
+        recipe_ids = list(Recipe.objects.order_by(
+            '-favorites_count', '-pub_date', 'id'
+        ).values_list('id', flat=True)[:POPULAR_RECIPES])
+        pages = min(
+            MAX_PAGES, max(1, math.ceil(
+                Recipe.objects.count() / RECIPES_PER_PAGE
+            ))
+        )
+        return loadtest.Sampler(
+            recipe_ids, list(Tag.objects.values_list('slug', flat=True)),
+            pages
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть больше 0.')
+        if not options['duration'] and not options['requests']:
+            raise CommandError('Задайте --duration или --requests.')
+        try:
+            flows = loadtest.build_flows(
+                self.load_schema(options['schema']),
+                loadtest.parse_mix(options['mix'])
+            )
+            sampler = self.sampler()
+        except loadtest.LoadTestError as error:
+            raise CommandError(error)
+        transport = (
+            functools.partial(loadtest.HttpTransport, options['url'])
+            if options['url'] else loadtest.InProcessTransport
+        )
+
+        report = loadtest.LoadTest(
+            flows, sampler, transport, self.tokens(options['users']),
+            concurrency=options['concurrency'],
+            duration=options['duration'], requests=options['requests'],
+            anonymous=options['anonymous'], seed=options['seed']
+        ).run()
+        report['target'] = options['url'] or 'in-process'
+        report['mix'] = {name: flow[0] for name, flow in flows.items()}
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if not options['output']:
+            self.stdout.write(output)
+            return
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["requests"]} запросов, '
+            f'{report["throughput_rps"]} запр./с, ошибок: {report["errors"]}. '
+            f'Отчёт: {options["output"]}'
+        ))
@@ -0,0 +1,483 @@
+import base64
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import quote
+
+from api import urls as api_urls
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import URLResolver, resolve
+from PIL import Image
+from recipes.generator import DataGenerator
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            ShoppingCartRecipe, Subscription, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+BUDGETS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'query_budgets.json'
+)
+
+BATCH_SIZE = 1000
+
+PASSWORD = 'Budget-pass-123'
+
+NEW_PASSWORD = 'Budget-pass-456'
+
+# Клиенты, от имени которых выполняются запросы.
+USER = 'user'
+GUEST = 'guest'
+STAFF = 'staff'
+ANON = 'anon'
+
+# Сценарии: имя, метод, путь, тело запроса, клиент.
+# Изменяющие данные сценарии идут парами и выполняются по одному разу.
+SCENARIOS = (
+    ('api-root', 'get', '/api/', None, USER),
+    ('recipes-list', 'get', '/api/recipes/', None, USER),
+    ('recipes-list-anonymous', 'get', '/api/recipes/', None, ANON),
+    ('recipes-list-last-page', 'get', '/api/recipes/?page={last_page}',
+     None, USER),
+    ('recipes-list-cursor', 'get', '/api/recipes/?cursor=', None, USER),
+    ('recipes-list-tags', 'get',
+     '/api/recipes/?tags={tag_slug}&tags={other_tag_slug}', None, USER),
+    ('recipes-list-favorited', 'get', '/api/recipes/?is_favorited=1',
+     None, USER),
+    ('recipes-list-not-favorited', 'get', '/api/recipes/?is_favorited=0',
+     None, USER),
+    ('recipes-list-in-cart', 'get', '/api/recipes/?is_in_shopping_cart=1',
+     None, USER),
+    ('recipes-list-not-in-cart', 'get',
+     '/api/recipes/?is_in_shopping_cart=0', None, USER),
+    ('recipes-list-author', 'get', '/api/recipes/?author={author}',
+     None, USER),
+    ('recipes-list-popular', 'get', '/api/recipes/?ordering=popular',
+     None, USER),
+    ('recipes-list-popular-cursor', 'get',
+     '/api/recipes/?ordering=popular&cursor=', None, USER),
+    ('recipes-list-search', 'get', '/api/recipes/?search={search}',
+     None, USER),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', None, USER),
+    ('recipes-detail-anonymous', 'get', '/api/recipes/{recipe}/',
+     None, ANON),
+    ('recipes-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', None, USER),
+    ('ingredient-list', 'get', '/api/ingredients/?name={ingredient_prefix}',
+     None, USER),
+    ('ingredient-detail', 'get', '/api/ingredients/{ingredient}/',
+     None, USER),
+    ('tag-list', 'get', '/api/tags/', None, USER),
+    ('tag-detail', 'get', '/api/tags/{tag}/', None, USER),
+    ('users-list', 'get', '/api/users/', None, USER),
+    ('users-list-anonymous', 'get', '/api/users/', None, ANON),
+    ('users-list-staff', 'get', '/api/users/', None, STAFF),
+    ('users-list-staff-cursor', 'get', '/api/users/?cursor=', None, STAFF),
+    ('users-list-staff-search', 'get', '/api/users/?search=author1',
+     None, STAFF),
+    ('users-detail', 'get', '/api/users/{author}/', None, USER),
+    ('users-me', 'get', '/api/users/me/', None, USER),
+    ('users-subscriptions', 'get', '/api/users/subscriptions/', None, USER),
+    ('users-subscriptions-cursor', 'get',
+     '/api/users/subscriptions/?cursor=', None, USER),
+    ('users-subscriptions-recipes-limit', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', None, USER),
+    ('recipes-create', 'post', '/api/recipes/', 'recipe_create', USER),
+    ('recipes-partial-update', 'patch', '/api/recipes/{own_recipe}/',
+     'recipe_update', USER),
+    ('recipes-destroy', 'delete', '/api/recipes/{disposable_recipe}/',
+     None, USER),
+    ('recipes-favorite-add', 'post', '/api/recipes/{recipe}/favorite/',
+     None, USER),
+    ('recipes-favorite-remove', 'delete', '/api/recipes/{recipe}/favorite/',
+     None, USER),
+    ('recipes-shopping-cart-add', 'post',
+     '/api/recipes/{recipe}/shopping_cart/', None, USER),
+    ('recipes-shopping-cart-remove', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', None, USER),
+    ('recipes-favorite-bulk-add', 'post', '/api/recipes/favorite/',
+     'bulk_recipes', USER),
+    ('recipes-favorite-bulk-remove', 'delete', '/api/recipes/favorite/',
+     'bulk_recipes', USER),
+    ('recipes-shopping-cart-bulk-add', 'post', '/api/recipes/shopping_cart/',
+     'bulk_recipes', USER),
+    ('recipes-shopping-cart-bulk-remove', 'delete',
+     '/api/recipes/shopping_cart/', 'bulk_recipes', USER),
+    ('users-subscribe', 'post', '/api/users/{new_author}/subscribe/',
+     None, USER),
+    ('users-unsubscribe', 'delete', '/api/users/{new_author}/subscribe/',
+     None, USER),
+    ('users-create', 'post', '/api/users/', 'user_create', ANON),
+    ('users-activation', 'post', '/api/users/activation/',
+     'bogus_token', ANON),
+    ('users-resend-activation', 'post', '/api/users/resend_activation/',
+     'guest_email', ANON),
+    ('users-reset-password', 'post', '/api/users/reset_password/',
+     'guest_email', ANON),
+    ('users-reset-password-confirm', 'post',
+     '/api/users/reset_password_confirm/', 'bogus_token', ANON),
+    ('users-reset-username', 'post', '/api/users/reset_username/',
+     'guest_email', ANON),
+    ('users-reset-username-confirm', 'post',
+     '/api/users/reset_username_confirm/', 'bogus_token', ANON),
+    ('login', 'post', '/api/auth/token/login/', 'login', ANON),
+    ('users-set-username', 'post', '/api/users/set_username/',
+     'set_username', GUEST),
+    ('users-set-password', 'post', '/api/users/set_password/',
+     'set_password', GUEST),
+    ('logout', 'post', '/api/auth/token/logout/', None, GUEST),
+    ('metrics', 'get', '/api/_metrics', None, STAFF),
+)
+
+# Сценарии, которые должны проходить успешно (2xx): иначе бюджет
+# записал бы стоимость ошибки валидации вместо настоящего пути.
+SUCCESS_REQUIRED = {
+    'users-create', 'users-reset-password', 'users-reset-username',
+    'login', 'users-set-username', 'users-set-password', 'logout',
+}
+
+
+def _route_names(patterns):
+    """Имена всех маршрутов, зарегистрированных в api/urls.py."""
+
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= _route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+class _AnyValue(dict):
+    """Подстановка для путей сценариев при проверке покрытия маршрутов."""
+
+    def __missing__(self, key):
+        return '1'
+
+
+def _image_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _image_payload():
+    return 'data:image/png;base64,' + base64.b64encode(
+        _image_bytes()
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер количества SQL-запросов и времени ответа всех эндпоинтов API '
+        'на одноразовой тестовой базе и сравнение с сохранёнными бюджетами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--authors', type=int)
+        parser.add_argument('--favorites', type=int, default=200)
+        parser.add_argument('--cart', type=int, default=200)
+        parser.add_argument('--subscriptions', type=int, default=200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=10)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--budgets', default=BUDGETS_FILE)
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Записать измеренные значения как новые бюджеты.'
+        )
+        parser.add_argument(
+            '--time-tolerance', type=float, default=0,
+            help=(
+                'Допустимое превышение бюджета времени (в разах). '
+                'По умолчанию время только выводится.'
+            )
+        )
+        parser.add_argument(
+            '--report', help='Путь для сохранения результатов в JSON.'
+        )
+
+    def handle(self, *args, **options):
+        uncovered = _route_names(api_urls.urlpatterns) - {
+            resolve(
+                path.split('?')[0].format_map(_AnyValue())
+            ).url_name
+            for _, _, path, _, _ in SCENARIOS
+        }
+        if uncovered:
+            raise CommandError(
+                'Нет сценариев для маршрутов: ' + ', '.join(sorted(uncovered))
+            )
+
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                # Фоновое создание копий картинок не входит в замер.
+                # Замер идёт с включёнными метриками запросов.
+                with override_settings(
+                    MEDIA_ROOT=media_root, RECIPE_IMAGE_WORKERS=0,
+                    PERFORMANCE_METRICS=True
+                ):
+                    context = self.seed(options)
+                    results = self.run_scenarios(context, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if options['update']:
+            failed = sorted(
+                name for name in SUCCESS_REQUIRED
+                if not 200 <= results[name]['status'] < 300
+            )
+            if failed:
+                raise CommandError(
+                    'Сценарии должны завершаться успешно (2xx): '
+                    + ', '.join(
+                        f'{name} ({results[name]["status"]})'
+                        for name in failed
+                    )
+                )
+            self.save_budgets(options['budgets'], results)
+            self.stdout.write(self.style.SUCCESS('Бюджеты обновлены.'))
+            return
+        self.check_budgets(
+            options['budgets'], results, options['time_tolerance']
+        )
+
+    def seed(self, options):
+        """Наполнение тестовой базы данными заданного объёма."""
+
+        started = time.perf_counter()
+        call_command('loadpredata', stdout=io.StringIO())
+        generator = DataGenerator(seed=options['seed'])
+        rnd = generator.random
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.all())
+
+        user = User.objects.create_user(
+            username='budget', email='budget@example.com',
+            password=PASSWORD, first_name='Budget', last_name='User'
+        )
+        guest = User.objects.create_user(
+            username='guest', email='guest@example.com',
+            password=PASSWORD, first_name='Guest', last_name='User'
+        )
+        staff = User.objects.create_user(
+            username='staff', email='staff@example.com',
+            password=PASSWORD, first_name='Staff', last_name='User',
+            is_staff=True
+        )
+        authors_count = options['authors'] or max(
+            options['subscriptions'] + 1, options['recipes'] // 20
+        )
+        author_ids = generator.users(authors_count, prefix='author')
+        links = {
+            'ingredients': (options['ingredients_per_recipe'], ) * 2,
+            'tags': (options['tags_per_recipe'], ) * 2,
+        }
+        catalog = generator.recipes(options['recipes'], author_ids, **links)
+        recipe_ids = catalog + generator.recipes(2, [user.id], **links)
+
+        favorites = rnd.sample(
+            catalog, min(options['favorites'], len(catalog))
+        )
+        cart = rnd.sample(catalog, min(options['cart'], len(catalog)))
+        FavoriteRecipe.objects.bulk_create(
+            (FavoriteRecipe(user=user, recipe_id=pk) for pk in favorites),
+            batch_size=BATCH_SIZE
+        )
+        ShoppingCartRecipe.objects.bulk_create(
+            (ShoppingCartRecipe(user=user, recipe_id=pk) for pk in cart),
+            batch_size=BATCH_SIZE
+        )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user=user, author_id=pk)
+                for pk in author_ids[:options['subscriptions']]
+            ),
+            batch_size=BATCH_SIZE
+        )
+        generator.finish()
+
+        self.stdout.write(
+            f'Тестовые данные: {len(recipe_ids)} рецептов, '
+            f'{len(author_ids)} авторов '
+            f'({time.perf_counter() - started:.1f} с).'
+        )
+        untouched = sorted(set(catalog) - set(favorites) - set(cart))
+        page_size = 6
+        return {
+            'clients': {
+                USER: self.client_for(user),
+                GUEST: self.client_for(guest),
+                STAFF: self.client_for(staff),
+                ANON: APIClient(raise_request_exception=False),
+            },
+            'recipe': untouched[0],
+            'own_recipe': recipe_ids[-2],
+            'disposable_recipe': recipe_ids[-1],
+            'author': author_ids[0],
+            'new_author': author_ids[-1],
+            'last_page': (len(recipe_ids) + page_size - 1) // page_size,
+            'tag': tags[0].id,
+            'tag_slug': tags[0].slug,
+            'other_tag_slug': tags[1].slug,
+            'ingredient': ingredient_ids[0],
+            'ingredient_prefix': quote('са'),
+            'search': quote(Recipe.objects.values_list(
+                'name', flat=True
+            ).get(pk=catalog[0])),
+            'payloads': self.payloads(
+                ingredient_ids, tags, guest, untouched[1:11]
+            ),
+        }
+
+    def client_for(self, user):
+        client = APIClient(raise_request_exception=False)
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def payloads(self, ingredient_ids, tags, guest, recipe_ids):
+        image = _image_payload()
+
+        def recipe(name):
+            return {
+                'ingredients': [
+                    {'id': pk, 'amount': 10} for pk in ingredient_ids[:15]
+                ],
+                'tags': [tag.id for tag in tags[:2]],
+                'image': image,
+                'name': name,
+                'text': f'{name}: описание',
+                'cooking_time': 15,
+            }
+
+        return {
+            'recipe_create': recipe('Новый рецепт'),
+            'recipe_update': recipe('Изменённый рецепт'),
+            'user_create': {
+                'email': 'new@example.com', 'username': 'new',
+                'first_name': 'New', 'last_name': 'User',
+                'password': PASSWORD,
+            },
+            'bulk_recipes': {'recipes': recipe_ids},
+            'guest_email': {'email': guest.email},
+            'bogus_token': {
+                'uid': 'MQ', 'token': 'invalid',
+                'new_password': NEW_PASSWORD,
+                'new_email': 'nobody@example.com',
+            },
+            'login': {'email': guest.email, 'password': PASSWORD},
+            'set_username': {
+                'new_email': 'guest2@example.com',
+                'current_password': PASSWORD,
+            },
+            'set_password': {
+                'new_password': NEW_PASSWORD, 'current_password': PASSWORD,
+            },
+        }
+
+    def run_scenarios(self, context, repeat):
+        """Выполнение сценариев с подсчётом запросов и времени ответа."""
+
+        results = {}
+        for name, method, path, payload, client in SCENARIOS:
+            url = path.format(**context)
+            data = context['payloads'][payload] if payload else None
+            runs = repeat if method == 'get' else 1
+            queries = 0
+            timings = []
+            for _ in range(runs):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(context['clients'][client], method)(
+                        url, data, format='json'
+                    )
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    timings.append(time.perf_counter() - started)
+                queries = max(queries, len(captured))
+            results[name] = {
+                'status': response.status_code,
+                'queries': queries,
+                'time_ms': round(statistics.median(timings) * 1000, 2),
+            }
+        return results
+
+    def save_budgets(self, path, results):
+        budgets = {
+            name: {
+                'status': result['status'],
+                'queries': result['queries'],
+                'time_ms': result['time_ms'],
+            } for name, result in results.items()
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(budgets, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    def check_budgets(self, path, results, time_tolerance):
+        """Сравнение результатов с бюджетами и вывод отчёта."""
+
+        with open(path, encoding='utf-8') as file:
+            budgets = json.load(file)
+
+        failures = []
+        for name, result in results.items():
+            budget = budgets.get(name)
+            problems = []
+            if budget is None:
+                problems.append('нет бюджета')
+            else:
+                if result['status'] != budget['status']:
+                    problems.append(
+                        f'статус {result["status"]} != {budget["status"]}'
+                    )
+                if result['queries'] > budget['queries']:
+                    problems.append(
+                        f'запросов {result["queries"]} > {budget["queries"]}'
+                    )
+                if (
+                    time_tolerance
+                    and result['time_ms'] > budget['time_ms'] * time_tolerance
+                ):
+                    problems.append(
+                        f'время {result["time_ms"]} мс > '
+                        f'{budget["time_ms"]} мс x {time_tolerance}'
+                    )
+            line = (
+                f'{name:<40} {result["status"]:>4} '
+                f'{result["queries"]:>4} запр. {result["time_ms"]:>9.2f} мс'
+            )
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{line}  {"; ".join(problems)}'
+                ))
+            else:
+                self.stdout.write(line)
+
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты: ' + ', '.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены.'))
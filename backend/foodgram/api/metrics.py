@@ -0,0 +1,242 @@
+"""
+Замер стоимости запросов: количество и время SQL-запросов,
+время рендеринга ответа и общее время.
+
+render - только рендеринг готовых данных (renderer.render(), например
+JSONRenderer). Сериализация (to_representation, serializer.data)
+выполняется в представлении и входит в app. Тело потоковых ответов
+(StreamingHttpResponse, например скачивание списка покупок)
+формируется после выхода из промежуточного слоя: его генерация
+и выполняемые при этом SQL-запросы в замеры не попадают.
+
+PerformanceMiddleware добавляет к ответу заголовок Server-Timing
+и накапливает гистограммы времени по представлениям (view_name
+маршрута). Гистограммы отдаются в текстовом формате Prometheus
+по адресу /api/_metrics (только администраторам).
+
+Метрики хранятся в памяти процесса: у каждого процесса gunicorn
+свои значения. При PERFORMANCE_METRICS = False промежуточный слой
+не подключается (MiddlewareNotUsed), а /api/_metrics отвечает 404.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.views import APIView
+
+# Границы корзин гистограмм времени (секунды).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Метрика: тип, описание.
+METRICS = {
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Общее время обработки запроса.'
+    ),
+    'foodgram_request_db_duration_seconds': (
+        'histogram', 'Время SQL-запросов за один запрос.'
+    ),
+    'foodgram_request_render_duration_seconds': (
+        'histogram', 'Время рендеринга ответа (без потоковых ответов).'
+    ),
+    'foodgram_request_db_queries_total': (
+        'counter', 'Количество SQL-запросов.'
+    ),
+    'foodgram_responses_total': (
+        'counter', 'Количество ответов по статусам.'
+    ),
+}
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"'
+        ).replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+class MetricsRegistry:
+    """Гистограммы и счётчики по меткам (view, method[, status])."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+
+    def record(self, view, method, status, total, db, queries, render):
+        labels = (('view', view), ('method', method))
+        with self.lock:
+            for name, value in (
+                ('foodgram_request_duration_seconds', total),
+                ('foodgram_request_db_duration_seconds', db),
+                ('foodgram_request_render_duration_seconds', render),
+            ):
+                self.histograms[name, labels].observe(value)
+            self.counters['foodgram_request_db_queries_total', labels] += (
+                queries
+            )
+            self.counters['foodgram_responses_total', labels + (
+                ('status', status),
+            )] += 1
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+
+        with self.lock:
+            histograms = {
+                key: (list(value.counts), value.sum, value.count)
+                for key, value in self.histograms.items()
+            }
+            counters = dict(self.counters)
+        lines = []
+        for metric, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            if kind == 'counter':
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric:
+                        lines.append(f'{metric}{{{_labels(labels)}}} {value}')
+                continue
+            for (name, labels), (counts, total, count) in sorted(
+                histograms.items()
+            ):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, counts):
+                    cumulative += bucket
+                    lines.append(
+                        f'{metric}_bucket'
+                        f'{{{_labels(labels + (("le", bound), ))}}} '
+                        f'{cumulative}'
+                    )
+                lines.append(
+                    f'{metric}_bucket'
+                    f'{{{_labels(labels + (("le", "+Inf"), ))}}} {count}'
+                )
+                lines.append(f'{metric}_sum{{{_labels(labels)}}} {total}')
+                lines.append(f'{metric}_count{{{_labels(labels)}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """Обёртка выполнения SQL (connection.execute_wrapper)."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class PerformanceMiddleware:
+    """
+    Server-Timing (db, render, app, total) для каждого ответа
+    и накопление метрик в registry.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._render_duration = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        render = request._render_duration
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timer.duration * 1000:.2f};'
+            f'desc="{timer.count} queries"',
+            f'render;dur={render * 1000:.2f}',
+            'app;dur={:.2f}'.format(
+                max(total - timer.duration - render, 0) * 1000
+            ),
+            f'total;dur={total * 1000:.2f}',
+        ))
+        match = request.resolver_match
+        registry.record(
+            view=match.view_name if match else 'unmatched',
+            method=request.method if request.method in METHODS else 'other',
+            status=response.status_code,
+            total=total, db=timer.duration, queries=timer.count,
+            render=render
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Ответ (в том числе Response DRF) рендерится сразу после этого
+        метода, конец рендеринга отмечает post-render callback.
+        """
+
+        started = time.perf_counter()
+
+        def finish(rendered):
+            request._render_duration += time.perf_counter() - started
+
+        response.add_post_render_callback(finish)
+        return response
+
+
+class MetricsView(APIView):
+    """Метрики в текстовом формате Prometheus."""
+
+    permission_classes = (permissions.IsAdminUser, )
+
+    def initial(self, request, *args, **kwargs):
+        if not settings.PERFORMANCE_METRICS:
+            raise NotFound
+        super().initial(request, *args, **kwargs)
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
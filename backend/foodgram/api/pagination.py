@@ -1,11 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import exceptions
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 RECIPES_PER_PAGE = 6
 
 MAX_PAGE_SIZE = 10
 
 
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (keyset): следующая страница выбирается условием
+    на поля сортировки последней записи, без OFFSET и COUNT(*).
+    Поля сортировки задаются атрибутом вьюсета cursor_ordering,
+    например ('-pub_date', 'id'). Если фильтр уже упорядочил выборку
+    по другим полям (например, по релевантности поиска search_rank),
+    курсор не может передать эту сортировку и запрос отклоняется (400).
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = RECIPES_PER_PAGE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    invalid_cursor_message = 'Неверный курсор.'
+    unsupported_ordering_message = (
+        'Курсор нельзя сочетать с сортировкой по {}.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = view.cursor_ordering
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        self.check_ordering(queryset)
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self._invert(name) for name in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+
+        self.next_position = self.previous_position = None
+        if page and (has_more or self.reverse):
+            self.next_position = self._position(page[-1])
+        if page and (has_more if self.reverse else position is not None):
+            self.previous_position = self._position(page[0])
+        return page
+
+    def check_ordering(self, queryset):
+        """Сортировка выборки не должна выходить за поля ключа."""
+
+        key = {name.lstrip('-') for name in self.ordering}
+        extra = [
+            name.lstrip('-') for name in queryset.query.order_by
+            if isinstance(name, str) and name.lstrip('-') not in key
+        ]
+        if extra:
+            message = self.unsupported_ordering_message.format(
+                ', '.join(extra)
+            )
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: message}
+            )
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({
+            'p': [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in position
+            ],
+            'r': int(reverse)
+        })
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(
+            remove_query_param(self.base_url, 'page'),
+            self.cursor_query_param,
+            cursor
+        )
+
+    def decode_cursor(self, request):
+        """Позиция курсора (значения полей сортировки) и направление."""
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = [
+                field.to_python(value)
+                for field, value in zip(self.fields, payload['p'])
+            ]
+            reverse = bool(payload['r'])
+        except (
+            TypeError, ValueError, KeyError, ValidationError, binascii.Error
+        ):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.fields):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _position(self, obj):
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def _invert(self, name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    def _after(self, position):
+        """
+        Условие «запись после позиции» для составного ключа:
+        (a > x) OR (a = x AND b > y) OR ... с учётом направлений.
+        """
+
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            descending = name.startswith('-') != self.reverse
+            lookup = 'lt' if descending else 'gt'
+            field = name.lstrip('-')
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+
 class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Постраничная пагинация (page/limit).
+    При наличии параметра cursor во вьюсетах с атрибутом cursor_ordering
+    включается пагинация по ключу (KeysetPagination).
+    """
+
     page_size = RECIPES_PER_PAGE
     page_query_param = 'page'
     page_size_query_param = 'limit'
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            self.keyset_pagination_class.cursor_query_param
+            in request.query_params
+            and getattr(view, 'cursor_ordering', None)
+        ):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
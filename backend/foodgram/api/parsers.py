@@ -0,0 +1,30 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """
+    multipart/form-data для создания и изменения рецептов.
+    Картинка передаётся файлом и записывается на диск по частям
+    (FILE_UPLOAD_HANDLERS). Вложенные поля ingredients и tags
+    передаются JSON-строками, tags - также повторяющимся полем.
+    """
+
+    json_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        data = {}
+        for key, values in result.data.lists():
+            if key not in self.json_fields:
+                data[key] = values[-1]
+            elif len(values) == 1 and values[0].lstrip().startswith('['):
+                try:
+                    data[key] = json.loads(values[0])
+                except ValueError as error:
+                    raise ParseError(f'Поле {key}: неверный JSON - {error}')
+            else:
+                data[key] = values
+        return DataAndFiles(data, result.files)
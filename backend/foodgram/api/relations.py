@@ -0,0 +1,81 @@
+"""
+Связи текущего пользователя с рецептами и авторами: id избранных
+рецептов, рецептов в списке покупок и авторов, на которых он подписан.
+
+Множества загружаются одним запросом, хранятся в версионном кэше
+пользователя и запоминаются в объекте запроса, поэтому поля
+is_favorited, is_in_shopping_cart и is_subscribed вычисляются
+проверкой вхождения без запросов к базе. Версия меняется при записи
+и удалении FavoriteRecipe, ShoppingCartRecipe и Subscription.
+"""
+from django.conf import settings
+from django.db import models
+from recipes.models import FavoriteRecipe, ShoppingCartRecipe, Subscription
+
+from .cache import bump_version_on_commit, get_or_build
+
+NAMESPACE = 'relations:{}'
+
+FAVORITES = 'favorites'
+
+SHOPPING_CART = 'shopping_cart'
+
+SUBSCRIPTIONS = 'subscriptions'
+
+# Имя множества: модель связи и поле с id связанного объекта.
+RELATIONS = {
+    FAVORITES: (FavoriteRecipe, 'recipe_id'),
+    SHOPPING_CART: (ShoppingCartRecipe, 'recipe_id'),
+    SUBSCRIPTIONS: (Subscription, 'author_id'),
+}
+
+EMPTY = {name: frozenset() for name in RELATIONS}
+
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+def build_relations(user_id):
+    """Множества связей пользователя (один запрос UNION ALL)."""
+
+    querysets = [
+        model.objects.filter(user_id=user_id).annotate(
+            relation=models.Value(name, output_field=models.CharField())
+        ).values_list('relation', field).order_by()
+        for name, (model, field) in RELATIONS.items()
+    ]
+    ids = {name: set() for name in RELATIONS}
+    for name, pk in querysets[0].union(*querysets[1:], all=True):
+        ids[name].add(pk)
+    return {name: frozenset(values) for name, values in ids.items()}
+
+
+def get_relations(request):
+    """
+    Связи пользователя запроса: словарь {имя: frozenset id}.
+    Для анонимного пользователя и вне запроса множества пустые.
+    """
+
+    if request is None or not request.user.is_authenticated:
+        return EMPTY
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None:
+        user_id = request.user.id
+        relations = get_or_build(
+            NAMESPACE.format(user_id),
+            lambda: build_relations(user_id),
+            settings.USER_RELATIONS_TIMEOUT
+        )
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
+
+
+def is_related(context, name, pk):
+    """Объект pk входит в множество name пользователя запроса."""
+
+    return pk in get_relations(context.get('request'))[name]
+
+
+def invalidate(user_id):
+    """Смена версии связей пользователя после фиксации транзакции."""
+
+    bump_version_on_commit(NAMESPACE.format(user_id))
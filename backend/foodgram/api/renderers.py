@@ -0,0 +1,154 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import exceptions, negotiation, renderers
+
+PDF_FONT_NAME = 'ShoppingListFont'
+
+PDF_FALLBACK_FONT = 'Helvetica'
+
+PDF_FONT_SIZE = 12
+
+PDF_MARGIN = 50
+
+PDF_LINE_HEIGHT = 18
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Базовый класс форматов списка покупок.
+    Список формируется построчно генератором stream(),
+    render() используется только для сообщений об ошибках.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode('utf-8')
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def stream(self, ingredients):
+        """
+        Генератор содержимого файла.
+        ingredients - итератор кортежей (название, единица, количество).
+        """
+
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        for number, (name, unit, amount) in enumerate(ingredients, 1):
+            yield f'{number}. {name} - {amount}, {unit}\n'
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Единицы'))
+        for name, unit, amount in ingredients:
+            yield writer.writerow((name, amount, unit))
+
+
+def _pdf_font():
+    """Регистрация шрифта с кириллицей (один раз на процесс)."""
+
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+    )
+    return PDF_FONT_NAME
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """
+    Формат PDF. В отличие от текста и CSV, построчной отдачи нет:
+    reportlab держит все страницы в памяти и пишет документ только
+    в save() (showPage ничего не выводит), а таблица ссылок PDF
+    записывается в конец файла. Поэтому весь файл собирается в буфере,
+    память растёт с длиной списка, и первый байт уходит клиенту только
+    после сборки. Затем буфер отдаётся частями по chunk_size.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    chunk_size = 64 * 1024
+
+    def stream(self, ingredients):
+        buffer = io.BytesIO()
+        font = _pdf_font()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        pdf.setFont(font, PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, 'Список покупок')
+        y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+        pdf.setFont(font, PDF_FONT_SIZE)
+        for number, (name, unit, amount) in enumerate(ingredients, 1):
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(
+                PDF_MARGIN, y, f'{number}. {name} - {amount}, {unit}'
+            )
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CsvShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
+
+
+class ShoppingListContentNegotiation(negotiation.DefaultContentNegotiation):
+    """
+    Формат из параметра format выбирается независимо от заголовка
+    Accept. Без параметра при Accept, которому не подходит ни один
+    формат (например, application/json), отдаётся первый формат -
+    текст, а не ответ 406.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except exceptions.NotAcceptable:
+            format_query = format_suffix or request.query_params.get(
+                self.settings.URL_FORMAT_OVERRIDE
+            )
+            if format_query:
+                renderers = self.filter_renderers(renderers, format_query)
+            return renderers[0], renderers[0].media_type
@@ -1,19 +1,31 @@
 import base64
+import binascii
 
 import webcolors
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.db import transaction
 from foodgram import settings
-from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from PIL import Image
+from recipes import images, search
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingListItem, Tag)
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from users.models import User
 from users.serializers import UserSerializer
 
+from . import relations
 from .pagination import RECIPES_PER_PAGE
 
 logger = settings.logging.getLogger(__name__)
 
+MAX_BULK_RECIPES = 100
+
+# Переносы строк и пробелы внутри base64 допустимы (MIME, PEM).
+BASE64_WHITESPACE = ' \t\n\r\x0b\x0c'
+
 
 class Hex2NameColor(serializers.Field):
     """Сериализатор для поля с цветом."""
@@ -46,16 +58,94 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
-    """Сериализатор для поля с изображением."""
+    """
+    Сериализатор для поля с изображением: файл multipart/form-data
+    или строка data:image/...;base64,...
+    Base64 декодируется по частям во временный файл на диске.
+    Размер файла и число пикселей проверяются по заголовку картинки
+    до её полного декодирования (защита от «декомпрессионных бомб»).
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер картинки больше {max_bytes} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+    base64_chunk_size = 64 * 1024
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            data = self.decode_base64(data)
+        if hasattr(data, 'size'):
+            self.check_limits(data)
         return super().to_internal_value(data)
 
+    def get_value(self, dictionary):
+        # Request.data объединяет словарь полей с MultiValueDict файлов,
+        # поэтому файл из multipart приходит списком из одного элемента.
+        value = super().get_value(dictionary)
+        if isinstance(value, list) and len(value) == 1:
+            return value[0]
+        return value
+
+    def decode_base64(self, data):
+        header, _, encoded = data.partition(';base64,')
+        ext = header.split('/')[-1]
+        length = len(encoded) - sum(map(encoded.count, BASE64_WHITESPACE))
+        if length // 4 * 3 > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        file = TemporaryUploadedFile(
+            'image.' + ext, f'image/{ext}', 0, None
+        )
+        try:
+            self.write_base64(file, encoded)
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def write_base64(self, file, encoded):
+        """
+        Декодирование по частям без пробельных символов. Часть режется
+        по границе группы из 4 символов, остаток переносится в следующую.
+        """
+
+        strip = str.maketrans('', '', BASE64_WHITESPACE)
+        rest = ''
+        for start in range(0, len(encoded), self.base64_chunk_size):
+            chunk = rest + encoded[
+                start:start + self.base64_chunk_size
+            ].translate(strip)
+            cut = len(chunk) - len(chunk) % 4
+            file.write(base64.b64decode(chunk[:cut], validate=True))
+            rest = chunk[cut:]
+        if rest:
+            raise binascii.Error('Incomplete base64 group.')
+
+    def check_limits(self, file):
+        if file.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        source = (
+            file.temporary_file_path()
+            if hasattr(file, 'temporary_file_path') else file
+        )
+        try:
+            with Image.open(source) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width, height = settings.RECIPE_IMAGE_MAX_PIXELS + 1, 1
+        except Exception:
+            # Неверный файл отклоняется проверкой ImageField.
+            return
+        finally:
+            file.seek(0)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+            )
+
 
 class RecipeAuthorSerializer(UserSerializer):
     """Сериализатор для поля author в общем сериализаторе рецептов."""
@@ -72,12 +162,53 @@ class RecipeAuthorSerializer(UserSerializer):
         )
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, проверяемый одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            if isinstance(pk, bool):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+            try:
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при many=True проверяет
+    все ключи одним запросом вместо запроса на каждый ключ.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
 class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
-    """Сериализатор для вложенного поля ingredients при создании рецепта."""
+    """
+    Сериализатор для вложенного поля ingredients при создании рецепта.
+    Существование ингредиентов проверяется сразу для всего списка
+    в CreateRecipeSerializer.validate_ingredients.
+    """
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = RecipeIngredient
@@ -125,6 +256,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -137,6 +269,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time'
         )
@@ -144,16 +277,41 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_is_favorited(self, obj):
         """Метод для вычисления поля is_favorited."""
 
-        return obj.favorited_by.filter(
-            favoriterecipe__user__id=self.context.get('request').user.id
-        ).exists()
+        return relations.is_related(self.context, relations.FAVORITES, obj.id)
+
+    def get_images(self, obj):
+        """
+        Уменьшенные копии картинки: {размер: {url, webp, width, height}}.
+        Пустой словарь, пока копии для текущей картинки не готовы.
+        """
+
+        if not images.is_current(obj):
+            return {}
+        request = self.context.get('request')
+
+        def url(name):
+            if not name:
+                return None
+            location = default_storage.url(name)
+            if request is None:
+                return location
+            return request.build_absolute_uri(location)
+
+        return {
+            size: {
+                'url': url(derivative['jpeg']),
+                'webp': url(derivative.get('webp')),
+                'width': derivative['width'],
+                'height': derivative['height'],
+            } for size, derivative in obj.images.items() if size != 'source'
+        }
 
     def get_is_in_shopping_cart(self, obj):
         """Метод для вычисления поля is_in_shopping_cart."""
 
-        return obj.in_shopping_cart_of.filter(
-            shoppingcartrecipe__user__id=self.context.get('request').user.id
-        ).exists()
+        return relations.is_related(
+            self.context, relations.SHOPPING_CART, obj.id
+        )
 
 
 class CreateRecipeSerializer(RecipeSerializer):
@@ -163,7 +321,7 @@ class CreateRecipeSerializer(RecipeSerializer):
         many=True,
         source='recipeingredient_set'
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -179,6 +337,95 @@ class CreateRecipeSerializer(RecipeSerializer):
             'cooking_time'
         )
 
+    def validate_ingredients(self, value):
+        """Ингредиенты без повторов и только существующие (один запрос)."""
+
+        ids = [item['ingredient_id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингредиенты не должны повторяться.')
+        missing = set(ids) - set(
+            Ingredient.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}.'
+            )
+        return value
+
+    def validate_tags(self, value):
+        if len(set(value)) != len(value):
+            raise ValidationError('Теги не должны повторяться.')
+        return value
+
+    def set_ingredients(self, recipe, ingredients, existing):
+        """
+        Приведение ингредиентов рецепта к списку ingredients.
+        existing - текущие строки {id ингредиента: RecipeIngredient}.
+        Новые строки добавляются bulk_create, изменённые - bulk_update,
+        лишние удаляются одним DELETE: число запросов не зависит
+        от количества ингредиентов.
+        Возвращает новые количества {id ингредиента: amount}.
+        """
+
+        after = {}
+        created, updated = [], []
+        for item in ingredients:
+            ingredient_id = item['ingredient_id']
+            row = existing.get(ingredient_id)
+            amount = item.get('amount', row.amount if row else None)
+            after[ingredient_id] = amount
+            if row is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                ))
+            elif row.amount != amount:
+                row.amount = amount
+                updated.append(row)
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in after
+        ]
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ['amount'])
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        return after
+
+    def set_tags(self, recipe, tags, existing):
+        """
+        Приведение тегов рецепта к списку tags.
+        existing - множество id текущих тегов рецепта.
+        """
+
+        tag_ids = {tag.id for tag in tags}
+        if tag_ids - existing:
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag_id=tag_id)
+                for tag_id in tag_ids - existing
+            )
+        if existing - tag_ids:
+            RecipeTag.objects.filter(
+                recipe=recipe,
+                tag_id__in=existing - tag_ids
+            ).delete()
+
+    def save(self, **kwargs):
+        """
+        Сохранение рецепта с закрытием временного файла картинки
+        (хранилище перемещает его на место, а не копирует).
+        """
+
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     @transaction.atomic
     def create(self, validated_data):
         """
@@ -192,18 +439,9 @@ class CreateRecipeSerializer(RecipeSerializer):
             **validated_data,
             author=self.context.get('request').user
         )
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
-                ingredient=ingredient.get('id'),
-                recipe=recipe,
-                amount=ingredient.get('amount')
-            )
-
-        for tag in tags:
-            RecipeTag.objects.create(
-                tag=tag,
-                recipe=recipe
-            )
+        self.set_ingredients(recipe, ingredients, {})
+        self.set_tags(recipe, tags, set())
+        search.index_recipes([recipe.pk])
 
         return recipe
 
@@ -211,40 +449,42 @@ class CreateRecipeSerializer(RecipeSerializer):
     def update(self, instance, validated_data):
         """
         Переопределение метода update.
-        Изменение рецепта с вложенными сериализаторами.
+        Изменение рецепта с вложенными сериализаторами: ингредиенты
+        и теги сравниваются с текущими, в базу пишется только разница.
+        Картинка с тем же содержимым не перезаписывается.
         """
-        ingredients = validated_data.pop('recipeingredient_set')
-        tags = validated_data.pop('tags')
 
-        instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('image', instance.image)
-        instance.text = validated_data.get('text', instance.text)
-        instance.save()
+        ingredients = validated_data.pop('recipeingredient_set', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.get('image')
+        if image is not None and instance.image.storage.is_same(
+            instance.image.name, image
+        ):
+            del validated_data['image']
 
-        for ingredient in ingredients:
-            ingredient_item, status = RecipeIngredient.objects.get_or_create(
-                ingredient=ingredient.get('id'),
-                recipe=instance
-            )
-            ingredient_item.amount = ingredient.get(
-                'amount',
-                ingredient_item.amount
-            )
-            ingredient_item.save()
-
-        new_recipe_tags = []
-        for tag in tags:
-            new_recipe_tag, status = RecipeTag.objects.get_or_create(
-                tag=tag,
-                recipe=instance
-            )
-            new_recipe_tags.append(new_recipe_tag)
-
-        all_recipe_tags = RecipeTag.objects.filter(recipe=instance)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save()
 
-        for tag in all_recipe_tags:
-            if tag not in new_recipe_tags:
-                tag.delete()
+        if ingredients is not None:
+            existing = {
+                row.ingredient_id: row
+                for row in RecipeIngredient.objects.filter(recipe=instance)
+            }
+            before = {
+                ingredient_id: row.amount
+                for ingredient_id, row in existing.items()
+            }
+            after = self.set_ingredients(instance, ingredients, existing)
+            ShoppingListItem.objects.change_recipe(instance, before, after)
+
+        if tags is not None:
+            self.set_tags(instance, tags, set(
+                RecipeTag.objects.filter(
+                    recipe=instance
+                ).values_list('tag_id', flat=True)
+            ))
+        search.index_recipes([instance.pk])
 
         return instance
 
@@ -258,10 +498,21 @@ class FavoriteRecipeSerializer(RecipeSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового изменения избранного и корзины."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+
 class SubscriptionSerializer(UserSerializer):
     """Сериализатор для подписок на авторов рецептов."""
 
@@ -282,14 +533,17 @@ class SubscriptionSerializer(UserSerializer):
         )
 
     def get_recipes(self, obj):
-        """Метод для ограничения количества объектов внутри поля recipes."""
+        """
+        Последние рецепты автора. Вьюсет подгружает их для всех авторов
+        страницы в атрибут latest_recipes с учётом recipes_limit.
+        """
 
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get(
-            'recipes_limit'
-        ) or RECIPES_PER_PAGE
-        recipes = obj.recipes.all()[:int(recipes_limit)]
-        serializer = FavoriteRecipeSerializer(recipes, many=True)
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[:RECIPES_PER_PAGE]
+        serializer = FavoriteRecipeSerializer(
+            recipes, many=True, context=self.context
+        )
 
         return serializer.data
 
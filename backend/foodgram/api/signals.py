@@ -0,0 +1,131 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCartRecipe,
+                            Subscription, Tag)
+from recipes.signals import catalog_loaded, recipes_changed
+from users.models import User
+
+from . import relations
+from .cache import RECIPES_NAMESPACE, TAGS_NAMESPACE, bump_version_on_commit
+from .indexes import INGREDIENTS_NAMESPACE
+
+# Модели, от которых зависят ответы со списком и страницей рецепта.
+# Связи рецепта удаляются вместе с рецептом, ингредиентом или тегом
+# либо при сохранении рецепта, поэтому для них достаточно post_save:
+# обработчик post_delete отключил бы быстрое удаление связей.
+# Рецепты удаляемого пользователя удаляются каскадом с post_delete
+# рецепта, поэтому удаление пользователя отдельно не обрабатывается.
+RECIPE_RESPONSE_SENDERS = (Recipe, Ingredient, Tag)
+
+RECIPE_LINK_SENDERS = (RecipeIngredient, RecipeTag)
+
+# Поля пользователя, которые входят в ответы с рецептами (автор).
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver((post_save, post_delete, catalog_loaded), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """
+    Перестроение индекса ингредиентов во всех процессах после фиксации
+    транзакции: до неё индекс собрался бы из незафиксированных строк.
+    """
+
+    bump_version_on_commit(INGREDIENTS_NAMESPACE)
+
+
+@receiver((post_save, post_delete, catalog_loaded), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    """Смена версии кэша тегов после фиксации транзакции."""
+
+    bump_version_on_commit(TAGS_NAMESPACE)
+
+
+def invalidate_recipe_responses(sender, **kwargs):
+    """Смена версии кэша ответов с рецептами после фиксации транзакции."""
+
+    bump_version_on_commit(RECIPES_NAMESPACE)
+
+
+def author_fields(user):
+    """
+    Значения полей автора без догрузки отложенных полей
+    (отложенное поле даёт None до обращения к нему).
+    """
+
+    return tuple(user.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_author_fields(sender, instance, **kwargs):
+    """Запоминание полей автора для сравнения при сохранении."""
+
+    instance._author_fields = author_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, created,
+                                update_fields=None, **kwargs):
+    """
+    Смена версии кэша ответов с рецептами, если изменились поля автора
+    у пользователя с рецептами. У нового пользователя рецептов нет,
+    а вход, смена пароля и другие сохранения ответы не меняют.
+    """
+
+    if created or update_fields is not None and not set(
+        update_fields
+    ) & set(AUTHOR_FIELDS):
+        return
+    current = author_fields(instance)
+    if current == instance._author_fields:
+        return
+    instance._author_fields = current
+    if instance.recipes.exists():
+        bump_version_on_commit(RECIPES_NAMESPACE)
+
+
+for model in RECIPE_RESPONSE_SENDERS + RECIPE_LINK_SENDERS:
+    post_save.connect(invalidate_recipe_responses, sender=model)
+for model in RECIPE_RESPONSE_SENDERS:
+    post_delete.connect(invalidate_recipe_responses, sender=model)
+recipes_changed.connect(invalidate_recipe_responses)
+
+
+# Связи пользователей удаляются явно (remove_recipes, отписка) или
+# каскадом вместе с рецептом и пользователем. Обработчик post_delete
+# отключил бы быстрое удаление связей, поэтому каскады обрабатываются
+# в pre_delete рецепта и пользователя.
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+@receiver(post_save, sender=Subscription)
+def invalidate_user_relations(sender, instance, **kwargs):
+    """Смена версии связей пользователя, изменившего свои связи."""
+
+    relations.invalidate(instance.user_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_users_relations(sender, instance, **kwargs):
+    """
+    Смена версии связей пользователей, у которых удаляемый рецепт
+    в избранном или в корзине (один запрос, одна смена на пользователя).
+    """
+
+    favorites, cart = (
+        model.objects.filter(recipe=instance).values_list(
+            'user_id', flat=True
+        ).order_by() for model in (FavoriteRecipe, ShoppingCartRecipe)
+    )
+    for user_id in favorites.union(cart):
+        relations.invalidate(user_id)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_followers_relations(sender, instance, **kwargs):
+    """Смена версии связей подписчиков удаляемого пользователя."""
+
+    for user_id in Subscription.objects.filter(
+        author=instance
+    ).values_list('user_id', flat=True):
+        relations.invalidate(user_id)
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Загрузка файла кусками во временный файл на диске.
+    Загрузка прерывается, как только файл превысил
+    RECIPE_IMAGE_MAX_BYTES, поэтому ни память, ни диск
+    не расходуются на слишком большие файлы.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.file.close()
+            raise MultiPartParserError(
+                f'Файл {self.file_name} больше '
+                f'{settings.RECIPE_IMAGE_MAX_BYTES} байт.'
+            )
+        return super().receive_data_chunk(raw_data, start)
@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework import routers
 from users.views import CustomUserSubscriptionViewSet
 
+from .metrics import MetricsView
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet
 
 app_name = 'api'
@@ -15,4 +16,5 @@ router.register('users', CustomUserSubscriptionViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,21 +1,32 @@
-from django.db import IntegrityError
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from foodgram import settings
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            ShoppingCartRecipe, Tag)
-from rest_framework import filters, permissions, serializers, status, viewsets
+                            ShoppingCartRecipe, ShoppingListItem, Tag)
+from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import _positive_int
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 
-from .filters import RecipeFilter
+from .cache import RECIPES_NAMESPACE, get_response_data, get_tags
+from .filters import (DEFAULT_RECIPE_ORDERING, RECIPE_ORDERINGS,
+                      RecipeFilter, RecipeSearchFilter)
+from .indexes import MAX_SEARCH_LIMIT, SEARCH_LIMIT, ingredient_index
+from . import relations
 from .pagination import StandardResultsSetPagination
+from .parsers import RecipeMultiPartParser
 from .permissions import RecipeAuthorOrReadOnlyPermission
+from .renderers import (SHOPPING_LIST_RENDERERS,
+                        ShoppingListContentNegotiation)
 from .serializers import (CreateRecipeSerializer, FavoriteRecipeSerializer,
-                          IngredientSerializer, RecipeSerializer,
-                          TagSerializer)
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeSerializer, TagSerializer)
 
 logger = settings.logging.getLogger(__name__)
 
@@ -23,18 +34,66 @@ logger = settings.logging.getLogger(__name__)
 class RecipeViewSet(viewsets.ModelViewSet):
     """
     CRUD операции по модели Recipe.
+    Рецепт принимается в JSON (картинка в base64)
+    или в multipart/form-data (картинка файлом).
     Дополнительные действия с избранными рецептами (@action).
     """
 
     queryset = Recipe.objects.all()
     pagination_class = StandardResultsSetPagination
+    parser_classes = (JSONParser, RecipeMultiPartParser)
     filterset_class = RecipeFilter
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter
+        RecipeSearchFilter
     ]
     search_fields = ('name',)
 
+    def get_queryset(self):
+        """
+        Для просмотра рецептов связанные объекты загружаются
+        фиксированным количеством запросов.
+        """
+
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.with_related()
+        return super().get_queryset()
+
+    @property
+    def cursor_ordering(self):
+        """Поля сортировки для пагинации по ключу (параметр ordering)."""
+
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'),
+            DEFAULT_RECIPE_ORDERING
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_for_anonymous(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_for_anonymous(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_for_anonymous(self, view, request, *args, **kwargs):
+        """
+        Ответ анонимному пользователю одинаков для всех анонимных
+        пользователей, поэтому его данные берутся из версионного кэша
+        по адресу и параметрам запроса. Версия меняется при изменении
+        рецептов, их ингредиентов и тегов, тегов и пользователей.
+        """
+
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        return Response(get_response_data(
+            RECIPES_NAMESPACE, request,
+            lambda: view(request, *args, **kwargs).data,
+            settings.RECIPE_CACHE_TIMEOUT
+        ))
+
     def get_serializer_class(self):
         """
         Определение разных сериализаторов для встроенных методов вьюсета.
@@ -66,54 +125,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         """Добавление рецепта в избранное/удаление из избранного."""
 
-        recipe = get_object_or_404(Recipe, pk=pk)
-        favorite_recipe = FavoriteRecipe.objects.filter(
-            user=request.user,
-            recipe=recipe
-        )
-        if request.method == 'DELETE':
-            favorite_recipe.delete()
-            return Response(
-                f'{recipe} удален из избранного',
-                status=status.HTTP_204_NO_CONTENT
-            )
-
-        try:
-            FavoriteRecipe.objects.create(user=request.user, recipe=recipe)
-        except IntegrityError as error:
-            return Response(f'{error}')
-        serializer = FavoriteRecipeSerializer(
-            recipe,
-            context={'request': request}
-        )
-        return Response(
-            serializer.data,
-            status=status.HTTP_200_OK
+        return self.change_user_recipe(
+            request, pk, FavoriteRecipe,
+            ('{} удален из избранного', '{} уже в избранном')
         )
 
     @action(methods=['post', 'delete'], detail=True)
     def shopping_cart(self, request, pk):
         """Добавление рецепта в список покупок/удаление из списка покупок."""
 
-        recipe = get_object_or_404(Recipe, pk=pk)
-        recipe_in_shopping_cart = ShoppingCartRecipe.objects.filter(
-            user=request.user,
-            recipe=recipe
+        return self.change_user_recipe(
+            request, pk, ShoppingCartRecipe,
+            ('{} удален из списка покупок', '{} уже в списке покупок'),
+            ShoppingListItem.objects
         )
+
+    @transaction.atomic
+    def change_user_recipe(self, request, pk, model, messages,
+                           aggregate=None):
+        """
+        Изменение связи пользователя с одним рецептом под той же
+        блокировкой пользователя, что и массовое изменение.
+        messages - шаблоны ответов об удалении и о повторном добавлении.
+        """
+
+        recipe = get_object_or_404(Recipe, pk=pk)
+        user = request.user
+        model.objects.lock_user(user)
         if request.method == 'DELETE':
-            recipe_in_shopping_cart.delete()
+            self.remove_user_recipes(user, model, aggregate, [recipe.id])
             return Response(
-                f'{recipe} удален из списка покупок',
+                messages[0].format(recipe),
                 status=status.HTTP_204_NO_CONTENT
             )
-
-        try:
-            ShoppingCartRecipe.objects.create(
-                user=request.user,
-                recipe=recipe
-            )
-        except IntegrityError as error:
-            return Response(f'{error}')
+        if not self.add_user_recipes(user, model, aggregate, [recipe.id]):
+            return Response(messages[1].format(recipe))
         serializer = FavoriteRecipeSerializer(
             recipe,
             context={'request': request}
@@ -123,54 +169,187 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
-    @action(methods=['get', ], detail=False)
-    def download_shopping_cart(self, request):
-        """Скачать список покупок текущего пользователя."""
-
-        ingredients = Ingredient.objects.filter(
-            recipeingredient__recipe__in_shopping_cart_of=request.user
-        ).annotate(total_amount=Sum(
-            'recipeingredient__amount')).order_by('name')
-
-        with open('shopping_cart.txt', 'w') as file:
-            n = 0
-            for ingredient in ingredients:
-                n += 1
-                file.write(
-                    f'{n}. {ingredient.name} - {ingredient.total_amount}'
-                    f', {ingredient.measurement_unit}')
-                file.write('\n')
-        file = open('shopping_cart.txt', 'r')
-
-        return HttpResponse(
-            file.read(),
-            headers={
-                'Content-Type': 'application/vnd.txt',
-                'Content-Disposition': (
-                    'attachment; filename="shopping_cart.txt"'
-                ),
-            },
-            status=status.HTTP_200_OK
+    @action(methods=['post', 'delete'], detail=False, url_path='favorite')
+    def favorite_bulk(self, request):
+        """
+        Добавление в избранное (POST) или удаление из избранного (DELETE)
+        списка рецептов из поля recipes.
+        """
+
+        return self.change_user_recipes(request, FavoriteRecipe)
+
+    @action(
+        methods=['post', 'delete'], detail=False, url_path='shopping_cart'
+    )
+    def shopping_cart_bulk(self, request):
+        """
+        Добавление в список покупок (POST) или удаление из списка покупок
+        (DELETE) списка рецептов из поля recipes.
+        """
+
+        return self.change_user_recipes(
+            request, ShoppingCartRecipe, ShoppingListItem.objects
         )
 
+    @transaction.atomic
+    def change_user_recipes(self, request, model, aggregate=None):
+        """
+        Массовое изменение связей пользователя с рецептами (избранное,
+        корзина) в одной транзакции за постоянное число запросов.
+        Строка пользователя блокируется, чтобы параллельные запросы
+        не учли один рецепт в счётчиках и агрегате корзины дважды.
+        Ответ: статус для каждого id - added, exists, not_found (POST)
+        или removed, absent (DELETE).
+        """
+
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        user = request.user
+        model.objects.lock_user(user)
+        if request.method == 'DELETE':
+            removed = set(self.remove_user_recipes(
+                user, model, aggregate, recipe_ids
+            ))
+            statuses = {
+                pk: 'removed' if pk in removed else 'absent'
+                for pk in recipe_ids
+            }
+        else:
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids
+            ).values_list('id', flat=True))
+            added = set(self.add_user_recipes(user, model, aggregate, [
+                pk for pk in recipe_ids if pk in existing
+            ]))
+            statuses = {
+                pk: 'added' if pk in added else (
+                    'exists' if pk in existing else 'not_found'
+                ) for pk in recipe_ids
+            }
+        return Response({'results': [
+            {'id': pk, 'status': statuses[pk]} for pk in recipe_ids
+        ]})
+
+    def add_user_recipes(self, user, model, aggregate, recipe_ids):
+        """
+        Добавление связей по id существующих рецептов (пользователь
+        заблокирован), возвращает id добавленных рецептов.
+        """
+
+        added = model.objects.add_recipes(user, recipe_ids)
+        if added:
+            if aggregate is not None:
+                aggregate.add_recipes(user, added)
+            relations.invalidate(user.id)
+        return added
+
+    def remove_user_recipes(self, user, model, aggregate, recipe_ids):
+        """
+        Удаление связей (пользователь заблокирован), возвращает id
+        рецептов, связи с которыми были удалены.
+        """
+
+        removed = model.objects.remove_recipes(user, recipe_ids)
+        if removed:
+            if aggregate is not None:
+                aggregate.remove_recipes(user, removed)
+            relations.invalidate(user.id)
+        return removed
+
+    @action(
+        methods=['get', ],
+        detail=False,
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+        content_negotiation_class=ShoppingListContentNegotiation
+    )
+    def download_shopping_cart(self, request, format=None):
+        """
+        Скачать список покупок текущего пользователя.
+        Формат выбирается параметром format: txt (по умолчанию), csv, pdf.
+        """
+
+        renderer = request.accepted_renderer
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by('ingredient__name').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()),
+            content_type=renderer.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    """Получение тэга, получение списка тэгов."""
+    """
+    Получение тэга, получение списка тэгов.
+    Ответы формируются из версионного кэша, без запросов к базе,
+    и поддерживают условные запросы (If-None-Match, If-Modified-Since).
+    """
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    def list(self, request, format=None):
+        tags = get_tags()
+        return self.conditional_response(
+            request, tags['list'], tags['etag'], tags['last_modified']
+        )
+
+    def retrieve(self, request, pk, format=None):
+        tags = get_tags()
+        if pk not in tags['by_id']:
+            raise NotFound
+        return self.conditional_response(
+            request, tags['by_id'][pk], tags['etags'][pk],
+            tags['last_modified']
+        )
+
+    def conditional_response(self, request, data, etag, last_modified):
+        """Ответ 304, если у клиента актуальная версия, иначе данные."""
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Получение ингредиента, получение списка ингредиентов.
     Поиск по частичному вхождению в начале названия ингредиента.
+    Ответы формируются из индекса в памяти, без запросов к базе.
     """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
 
-    def get_queryset(self):
-        search_params = self.request.GET.get('name')
-        return Ingredient.objects.filter(name__istartswith=search_params)
+    def list(self, request, format=None):
+        try:
+            limit = _positive_int(
+                request.query_params['limit'],
+                strict=True,
+                cutoff=MAX_SEARCH_LIMIT
+            )
+        except (KeyError, ValueError):
+            limit = SEARCH_LIMIT
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit
+        ))
+
+    def retrieve(self, request, pk, format=None):
+        ingredient = ingredient_index.get(int(pk)) if pk.isdigit() else None
+        if ingredient is None:
+            raise NotFound
+        return Response(ingredient)
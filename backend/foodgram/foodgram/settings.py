@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django_filters',
     'rest_framework.authtoken',
     'djoser',
+    'sorl.thumbnail',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
     'api.apps.ApiConfig'
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'api.metrics.PerformanceMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,6 +80,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -112,8 +124,16 @@ DJOSER = {
     'SERIALIZERS': {
         'user_create': 'users.serializers.CustomUserCreateSerializer'
     },
+    # Ссылки в письмах активации и сброса пароля или логина.
+    'ACTIVATION_URL': 'activate/{uid}/{token}',
+    'PASSWORD_RESET_CONFIRM_URL': 'reset-password/{uid}/{token}',
+    'USERNAME_RESET_CONFIRM_URL': 'reset-username/{uid}/{token}',
 }
 
+EMAIL_BACKEND = os.getenv(
+    'EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend'
+)
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -131,4 +151,40 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend-static')
 MEDIA_URL = '/backend-media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend-media')
+
+INGREDIENT_INDEX_TIMEOUT = int(os.getenv(
+    'INGREDIENT_INDEX_TIMEOUT', default=60 * 60
+))
+
+TAG_CACHE_TIMEOUT = int(os.getenv('TAG_CACHE_TIMEOUT', default=60 * 60))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=5 * 60))
+
+USER_RELATIONS_TIMEOUT = int(os.getenv(
+    'USER_RELATIONS_TIMEOUT', default=60 * 60
+))
+
+RECIPE_IMAGE_WEBP = os.getenv('RECIPE_IMAGE_WEBP', default='1') == '1'
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+RECIPE_IMAGE_MAX_BYTES = int(os.getenv(
+    'RECIPE_IMAGE_MAX_BYTES', default=5 * 1024 * 1024
+))
+
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv(
+    'RECIPE_IMAGE_MAX_PIXELS', default=4096 * 4096
+))
+
+# Server-Timing и метрики Prometheus (/api/_metrics).
+PERFORMANCE_METRICS = os.getenv('PERFORMANCE_METRICS', default='0') == '1'
+
+FILE_UPLOAD_HANDLERS = [
+    'api.uploads.LimitedTemporaryFileUploadHandler',
+]
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
 # DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -7,10 +7,21 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from api.indexes import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.refresh()
+except DatabaseError as error:
+    logging.getLogger(__name__).warning(
+        'Индекс ингредиентов не построен при запуске: %s', error
+    )
@@ -1,28 +1,73 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
-from .models import Ingredient, Recipe, Tag
+from . import search
+from .admin_tools import (LargeTableAdminMixin, autocomplete_filter,
+                          chunked_action, delete_in_chunks)
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+@chunked_action('Обновить поисковый индекс')
+def reindex_search(modeladmin, request, queryset):
+    recipe_ids = list(queryset.values_list('id', flat=True))
+    search.index_recipes(recipe_ids)
+    return len(recipe_ids)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Рецепты: счётчики избранного и корзины хранятся в рецепте,
+    автор выбирается автодополнением и в фильтре, и в форме.
+    """
+
     list_display = (
         'name',
         'author',
-        'count_favorited_by'
+        'pub_date',
+        'favorites_count',
+        'shopping_cart_count'
     )
-    list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author', )
+    list_filter = (autocomplete_filter('author', 'автору'), 'tags')
+    search_fields = ('^name', )
+    autocomplete_fields = ('author', )
+    actions = (delete_in_chunks, reindex_search)
 
-    @admin.display()
-    def count_favorited_by(self, obj):
-        return obj.favorited_by.count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        search.index_recipes([form.instance.pk])
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit')
-    list_filter = ('name', )
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Ингредиенты: поиск по началу названия вместо фильтра по всем
+    названиям, количество рецептов - подзапросом для строк страницы.
+    """
+
+    list_display = ('name', 'measurement_unit', 'recipes_count')
+    search_fields = ('^name', )
+    actions = (delete_in_chunks, )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=Coalesce(Subquery(
+                RecipeIngredient.objects.filter(
+                    ingredient=OuterRef('pk')
+                ).order_by().values('ingredient').annotate(
+                    total=Count('id')
+                ).values('total')
+            ), 0)
+        )
+
+    @admin.display(description='Рецептов', ordering='recipes_count')
+    def recipes_count(self, obj):
+        return obj.recipes_count
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'color', 'slug')
+    search_fields = ('^name', '^slug')
@@ -0,0 +1,242 @@
+"""
+Инструменты для списков админки на больших таблицах:
+оценка количества строк вместо COUNT(*), фильтры по внешнему ключу
+с автодополнением и действия, обрабатывающие выборку частями.
+"""
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections, models, transaction
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+# Начиная с этого количества строк таблицы без фильтров
+# используется оценка PostgreSQL (pg_class.reltuples).
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+ACTION_CHUNK_SIZE = 1000
+
+# Страница подтверждения считает выбранные строки не дальше этого предела.
+CONFIRMATION_COUNT_LIMIT = 10000
+
+
+def estimated_count(queryset):
+    """
+    Оценка количества строк таблицы по статистике PostgreSQL
+    или None, если оценка неприменима (другая СУБД, есть фильтры).
+    """
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, не считающий строки больших таблиц через COUNT(*).
+    object_list - QuerySet.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        # Аннотации списка (например, счётчики подзапросами)
+        # не нужны для подсчёта строк и не попадают в него.
+        return self.object_list.values('pk').count()
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Фильтр по внешнему ключу field_name: значение выбирается
+    автодополнением (select2 админки), список всех связанных объектов
+    не загружается. У админки связанной модели должны быть search_fields.
+    """
+
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False
+        )
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name]
+            ),
+            'display': 'Все',
+        }
+
+    def rendered_widget(self):
+        return self.form_field.widget.render(
+            self.parameter_name, self.value(),
+            attrs={'class': 'autocomplete-filter'}
+        )
+
+
+def autocomplete_filter(field_name, title):
+    """Класс AutocompleteFilter для поля field_name."""
+
+    return type(
+        f'{field_name.title()}AutocompleteFilter',
+        (AutocompleteFilter, ),
+        {'field_name': field_name, 'title': title}
+    )
+
+
+class LargeTableAdminMixin:
+    """
+    Список объектов без полного COUNT(*): оценка количества строк
+    и отключённый подсчёт всех строк при фильтрации.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        if any(
+            isinstance(spec, type) and issubclass(spec, AutocompleteFilter)
+            for spec in self.list_filter
+        ):
+            media += AutocompleteSelect(None, self.admin_site).media
+            media += forms.Media(js=('admin/js/autocomplete_filter.js', ))
+        return media
+
+
+def count_label(queryset, limit=CONFIRMATION_COUNT_LIMIT):
+    """
+    Количество строк выборки для показа без полного COUNT(*): оценка
+    PostgreSQL для таблицы без фильтров, иначе подсчёт не дальше limit.
+    """
+
+    estimate = estimated_count(queryset)
+    if estimate is not None:
+        return f'около {estimate}'
+    count = queryset.values('pk')[:limit + 1].count()
+    return f'более {limit}' if count > limit else str(count)
+
+
+def cascade_models(model):
+    """Названия моделей, строки которых удаляются каскадом вместе с model."""
+
+    return sorted({
+        str(relation.related_model._meta.verbose_name_plural)
+        for relation in model._meta.related_objects
+        if relation.on_delete is models.CASCADE
+        and not relation.related_model._meta.auto_created
+    })
+
+
+def confirmation_response(modeladmin, request, queryset, action_name, title):
+    """
+    Страница подтверждения действия в духе delete_selected: вместо
+    списка всех объектов и связей - примерное количество выбранных
+    строк и модели, затрагиваемые каскадом. Выбор «все на всех
+    страницах» передаётся дальше флагом select_across.
+    """
+
+    opts = modeladmin.model._meta
+    request.current_app = modeladmin.admin_site.name
+    return TemplateResponse(
+        request, 'admin/chunked_action_confirmation.html', {
+            **modeladmin.admin_site.each_context(request),
+            'title': title,
+            'opts': opts,
+            'media': modeladmin.media,
+            'action_name': action_name,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'count': count_label(queryset),
+            'cascade': cascade_models(modeladmin.model),
+        }
+    )
+
+
+def chunked_action(description, permissions=None,
+                   chunk_size=ACTION_CHUNK_SIZE, confirmation=None):
+    """
+    Действие админки над выбранными объектами частями по chunk_size
+    объектов в порядке первичного ключа, каждая часть - в отдельной
+    транзакции, без загрузки всех ключей выборки в память.
+    Функция handle(modeladmin, request, queryset) получает queryset
+    одной части и возвращает количество обработанных объектов.
+    Если задан confirmation (заголовок страницы подтверждения),
+    действие выполняется только после подтверждения.
+    """
+
+    def decorator(handle):
+        def action(modeladmin, request, queryset):
+            if confirmation and not request.POST.get('post'):
+                return confirmation_response(
+                    modeladmin, request, queryset, handle.__name__,
+                    confirmation
+                )
+            queryset = queryset.order_by('pk')
+            done, last = 0, None
+            while True:
+                chunk = queryset if last is None else queryset.filter(
+                    pk__gt=last
+                )
+                pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    break
+                with transaction.atomic():
+                    done += handle(
+                        modeladmin, request,
+                        modeladmin.model._default_manager.filter(pk__in=pks)
+                    )
+                last = pks[-1]
+            modeladmin.message_user(
+                request, f'Обработано объектов: {done}.', messages.SUCCESS
+            )
+
+        action.__name__ = handle.__name__
+        return admin.action(
+            description=description, permissions=permissions
+        )(action)
+
+    return decorator
+
+
+@chunked_action(
+    'Удалить выбранные частями', permissions=['delete'],
+    confirmation='Удаление выбранных объектов частями'
+)
+def delete_in_chunks(modeladmin, request, queryset):
+    """Удаление через ModelAdmin.delete_queryset после подтверждения."""
+
+    count = queryset.count()
+    modeladmin.delete_queryset(request, queryset)
+    return count
@@ -0,0 +1,180 @@
+"""
+Потоковая загрузка справочников (ингредиенты, теги) из файлов
+CSV, JSON и JSON Lines, в том числе сжатых gzip (*.csv.gz, ...).
+
+Строки читаются и вставляются пачками по batch_size, уже существующие
+строки пропускаются по ограничениям уникальности, поэтому повторная
+загрузка того же файла ничего не меняет. В PostgreSQL пачка передаётся
+через COPY во временную таблицу и переносится одним
+INSERT ... ON CONFLICT DO NOTHING.
+"""
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import time
+
+from django.db import connections, router, transaction
+
+from .models import Ingredient, Tag
+from .signals import catalog_loaded
+
+BATCH_SIZE = 5000
+
+# Справочник: модель и загружаемые поля.
+CATALOGS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+    'tags': (Tag, ('name', 'color', 'slug')),
+}
+
+FORMATS = ('.csv', '.json', '.jsonl')
+
+
+class CatalogError(ValueError):
+    """Файл справочника не удаётся прочитать."""
+
+
+def get_format(path):
+    """Формат файла по расширению (без .gz)."""
+
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in FORMATS:
+        raise CatalogError(
+            f'{path}: неизвестный формат, ожидается '
+            f'{", ".join(FORMATS)} (можно со сжатием .gz).'
+        )
+    return extension
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_rows(path, fields):
+    """
+    Строки файла как кортежи значений fields. CSV и JSON Lines
+    читаются потоково, JSON (массив объектов) - целиком.
+    """
+
+    file_format = get_format(path)
+    with open_text(path) as file:
+        if file_format == '.csv':
+            records = csv.DictReader(file)
+        elif file_format == '.jsonl':
+            records = (json.loads(line) for line in file if line.strip())
+        else:
+            records = json.load(file)
+        for number, record in enumerate(records, 1):
+            try:
+                yield tuple(record[field].strip() for field in fields)
+            except (KeyError, AttributeError, TypeError):
+                raise CatalogError(
+                    f'{path}: запись {number} не содержит '
+                    f'полей {", ".join(fields)}.'
+                )
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CopyLoader:
+    """
+    Пачка передаётся через COPY во временную таблицу со столбцами
+    fields и переносится в таблицу модели с пропуском конфликтов.
+    """
+
+    def __init__(self, connection, model, fields):
+        self.connection = connection
+        self.table = model._meta.db_table
+        self.temp_table = f'{self.table}_load'
+        quote = connection.ops.quote_name
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column) for field in fields
+        )
+        self.create_sql = (
+            'CREATE TEMPORARY TABLE IF NOT EXISTS '
+            f'{quote(self.temp_table)} '
+            f'ON COMMIT DROP AS SELECT {columns} FROM {quote(self.table)} '
+            'WITH NO DATA'
+        )
+        self.copy_sql = (
+            f'COPY {quote(self.temp_table)} ({columns}) '
+            'FROM STDIN WITH (FORMAT csv)'
+        )
+        self.insert_sql = (
+            f'INSERT INTO {quote(self.table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(self.temp_table)} '
+            'ON CONFLICT DO NOTHING'
+        )
+        self.truncate_sql = f'TRUNCATE {quote(self.temp_table)}'
+
+    def load(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                cursor.execute(self.create_sql)
+                cursor.cursor.copy_expert(self.copy_sql, buffer)
+                cursor.execute(self.insert_sql)
+                cursor.execute(self.truncate_sql)
+
+
+class BulkCreateLoader:
+    """Пачка вставляется bulk_create(ignore_conflicts=True)."""
+
+    def __init__(self, connection, model, fields):
+        self.connection = connection
+        self.model = model
+        self.fields = fields
+
+    def load(self, batch):
+        self.model._default_manager.db_manager(
+            self.connection.alias
+        ).bulk_create(
+            (self.model(**dict(zip(self.fields, row))) for row in batch),
+            batch_size=len(batch),
+            ignore_conflicts=True
+        )
+
+
+def load(catalog, path, batch_size=BATCH_SIZE, use_copy=True,
+         progress=None):
+    """
+    Загрузка файла path в справочник catalog, возвращает количество
+    прочитанных и добавленных строк и время загрузки в секундах.
+    progress(read, seconds) вызывается после каждой пачки.
+    """
+
+    model, fields = CATALOGS[catalog]
+    connection = connections[router.db_for_write(model)]
+    loader_class = (
+        CopyLoader if use_copy and connection.vendor == 'postgresql'
+        else BulkCreateLoader
+    )
+    loader = loader_class(connection, model, fields)
+    manager = model._default_manager.db_manager(connection.alias)
+    before = manager.count()
+    read = 0
+    started = time.monotonic()
+    for batch in batches(read_rows(path, fields), batch_size):
+        loader.load(batch)
+        read += len(batch)
+        if progress is not None:
+            progress(read, time.monotonic() - started)
+    seconds = time.monotonic() - started
+    created = manager.count() - before
+    if created:
+        catalog_loaded.send(sender=model)
+    return read, created, seconds
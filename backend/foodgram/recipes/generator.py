@@ -0,0 +1,294 @@
+"""
+Генерация синтетических данных для нагрузочного тестирования.
+
+Объёмы задаются явно, случайность воспроизводима (seed). Популярность
+распределена по закону Ципфа: немногие авторы пишут большую часть
+рецептов, немногие рецепты собирают большую часть избранного и корзин,
+на немногих авторов подписана большая часть пользователей.
+Строки вставляются пачками через bulk_create без сигналов, поэтому
+после генерации вызывается finish(): счётчики рецептов, агрегат
+списков покупок и поисковый индекс пересчитываются одним проходом.
+"""
+import datetime
+import io
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import search
+from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCartRecipe, ShoppingListItem,
+                     Subscription, Tag)
+
+BATCH_SIZE = 5000
+
+# Показатель степени распределения Ципфа: чем больше, тем сильнее
+# популярность сосредоточена в начале рейтинга.
+SKEW = 1.1
+
+IMAGE_NAME = 'recipes/images/generated.png'
+
+# Даты публикации рецептов распределены за этот период до текущего момента.
+PUBLICATION_DAYS = 365
+
+DISHES = (
+    'Салат', 'Суп', 'Борщ', 'Рагу', 'Запеканка', 'Пирог', 'Омлет',
+    'Каша', 'Паста', 'Плов', 'Котлеты', 'Блины', 'Оладьи', 'Соус',
+    'Жаркое', 'Пицца', 'Ризотто', 'Десерт', 'Смузи', 'Гратен',
+)
+
+
+def zipf_weights(count, skew=SKEW):
+    """Накопленные веса рангов 1..count для random.choices."""
+
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)
+    ))
+
+
+def _batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+class DataGenerator:
+    """
+    Генератор строк пользователей, рецептов и связей между ними.
+    progress(name, created, seconds) вызывается после каждой пачки.
+    """
+
+    def __init__(self, seed=0, skew=SKEW, batch_size=BATCH_SIZE,
+                 progress=None):
+        self.random = random.Random(seed)
+        self.skew = skew
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def choose(self, population, weights, count):
+        """
+        До count различных элементов population с учётом популярности
+        (повторные выборы отбрасываются).
+        """
+
+        if count <= 0 or not population:
+            return []
+        return list(dict.fromkeys(self.random.choices(
+            population, cum_weights=weights, k=count
+        )))
+
+    def ranked(self, ids):
+        """Случайный рейтинг популярности ids и веса его позиций."""
+
+        ranking = list(ids)
+        self.random.shuffle(ranking)
+        return ranking, zipf_weights(len(ranking), self.skew)
+
+    def insert(self, name, model, objects):
+        """
+        Вставка объектов пачками без конфликтов уникальности.
+        Возвращает количество вставленных строк: строки, пропущенные
+        из-за конфликтов, не учитываются (считаются новые id в таблице).
+        """
+
+        created = 0
+        last_id = self.last_id(model)
+        started = time.monotonic()
+        for batch in _batches(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            inserted = model.objects.filter(id__gt=last_id).aggregate(
+                count=models.Count('id'), last_id=models.Max('id')
+            )
+            created += inserted['count']
+            last_id = inserted['last_id'] or last_id
+            if self.progress is not None:
+                self.progress(name, created, time.monotonic() - started)
+        return created
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def new_ids(self, model, last_id):
+        return list(
+            model.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def users(self, count, prefix='user', password=None):
+        """
+        Пользователи {prefix}{номер} с общим паролем (по умолчанию
+        без возможности входа по паролю), возвращает их id.
+        """
+
+        from users.models import User
+
+        last_id = self.last_id(User)
+        password = make_password(password)
+        self.insert('users', User, (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=prefix.title(), last_name=str(number),
+                password=password
+            ) for number in range(last_id + 1, last_id + count + 1)
+        ))
+        return self.new_ids(User, last_id)
+
+    def image(self):
+        """Общая картинка сгенерированных рецептов."""
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'orange').save(buffer, format='PNG')
+        return Recipe._meta.get_field('image').storage.save(
+            IMAGE_NAME, ContentFile(buffer.getvalue())
+        )
+
+    def recipes(self, count, author_ids, ingredients=(3, 12), tags=(1, 3),
+                days=PUBLICATION_DAYS):
+        """
+        Рецепты авторов author_ids (популярные авторы пишут больше)
+        с ingredients и tags - наименьшим и наибольшим количеством
+        ингредиентов и тегов рецепта, возвращает id рецептов.
+        Рецепты и их связи вставляются вместе, пачка за пачкой.
+        Даты публикации равномерно распределены за days дней
+        (рецепты с большим id новее), чтобы сортировка по дате
+        и пагинация по ключу работали как на настоящих данных.
+        """
+
+        ingredient_rows = list(Ingredient.objects.order_by('id').values_list(
+            'id', 'name'
+        ))
+        ingredient_ranking, ingredient_weights = self.ranked(ingredient_rows)
+        tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        author_ranking, author_weights = self.ranked(author_ids)
+        image = self.image()
+        last_id = self.last_id(Recipe)
+        now = timezone.now()
+        period = datetime.timedelta(days=days)
+
+        created = 0
+        started = time.monotonic()
+        numbers = range(last_id + 1, last_id + count + 1)
+        for batch in _batches(numbers, self.batch_size):
+            recipes, links, dates = [], {}, {}
+            for number in batch:
+                chosen = self.choose(
+                    ingredient_ranking, ingredient_weights,
+                    self.random.randint(*ingredients)
+                )
+                name = f'{self.random.choice(DISHES)} {number}'
+                dates[name] = now - period * (
+                    1 - (number - last_id - self.random.random()) / count
+                )
+                links[name] = (
+                    [pk for pk, _ in chosen],
+                    self.random.sample(
+                        tag_ids, min(self.random.randint(*tags), len(tag_ids))
+                    )
+                )
+                recipes.append(Recipe(
+                    name=name,
+                    text=f'{name}: ' + ', '.join(
+                        ingredient_name for _, ingredient_name in chosen
+                    ) + '.',
+                    author_id=self.random.choices(
+                        author_ranking, cum_weights=author_weights
+                    )[0],
+                    image=image,
+                    cooking_time=self.random.randint(5, 180)
+                ))
+            Recipe.objects.bulk_create(recipes, ignore_conflicts=True)
+            # Уже существовавшие рецепты с тем же названием не трогаем.
+            recipe_ids = dict(Recipe.objects.filter(
+                name__in=links, id__gt=last_id
+            ).values_list('name', 'id'))
+            # pub_date (auto_now_add) задаётся только после вставки.
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(id=pk, pub_date=dates[name])
+                    for name, pk in recipe_ids.items()
+                ],
+                ['pub_date'], batch_size=1000
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe_ids[name], ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500)
+                )
+                for name, (recipe_ingredients, _) in links.items()
+                if name in recipe_ids
+                for ingredient_id in recipe_ingredients
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe_ids[name], tag_id=tag_id)
+                for name, (_, recipe_tags) in links.items()
+                if name in recipe_ids
+                for tag_id in recipe_tags
+            )
+            created += len(recipe_ids)
+            if self.progress is not None:
+                self.progress('recipes', created, time.monotonic() - started)
+        return self.new_ids(Recipe, last_id)
+
+    def user_recipes(self, model, user_ids, recipe_ids, per_user):
+        """
+        Связи пользователей с рецептами (избранное или корзина):
+        в среднем per_user рецептов у пользователя, количество
+        у отдельных пользователей распределено экспоненциально.
+        """
+
+        ranking, weights = self.ranked(recipe_ids)
+        return self.insert(model._meta.model_name, model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.choose(
+                ranking, weights, round(self.random.expovariate(
+                    1 / per_user
+                )) if per_user > 0 else 0
+            )
+        ))
+
+    def favorites(self, user_ids, recipe_ids, per_user):
+        return self.user_recipes(
+            FavoriteRecipe, user_ids, recipe_ids, per_user
+        )
+
+    def shopping_cart(self, user_ids, recipe_ids, per_user):
+        return self.user_recipes(
+            ShoppingCartRecipe, user_ids, recipe_ids, per_user
+        )
+
+    def subscriptions(self, user_ids, author_ids, per_user):
+        """Подписки пользователей на авторов (популярных - чаще)."""
+
+        ranking, weights = self.ranked(author_ids)
+        return self.insert('subscriptions', Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.choose(
+                ranking, weights, round(self.random.expovariate(
+                    1 / per_user
+                )) if per_user > 0 else 0
+            )
+            if author_id != user_id
+        ))
+
+    def finish(self):
+        """Пересчёт данных, которые bulk_create не обновляет."""
+
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild()
+        Recipe.objects.reconcile_counters()
+        search.index_recipes()
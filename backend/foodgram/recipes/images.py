@@ -0,0 +1,127 @@
+"""
+Уменьшенные копии картинок рецептов (thumbnail, card, full).
+
+Копии создаются sorl-thumbnail в пуле фоновых потоков после фиксации
+транзакции, в которой изменилась картинка, и сохраняются в поле
+Recipe.images вместе с именем исходного файла (source). Пока копии
+не готовы или устарели, клиенты используют исходную картинку.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from sorl.thumbnail import get_thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Имя копии: геометрия и параметры sorl-thumbnail.
+DERIVATIVES = {
+    'thumbnail': ('160x160', {'crop': 'center'}),
+    'card': ('480x360', {'crop': 'center'}),
+    'full': ('1280x1280', {'upscale': False}),
+}
+
+JPEG_QUALITY = 85
+
+WEBP_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_current(recipe):
+    """Копии построены для текущей картинки рецепта."""
+
+    return bool(
+        recipe.image and recipe.images
+        and recipe.images.get('source') == recipe.image.name
+    )
+
+
+def build(image_name):
+    """
+    Создание копий картинки, возвращает значение для Recipe.images
+    или None, если исходного файла нет в хранилище.
+    """
+
+    if not default_storage.exists(image_name):
+        logger.warning('Картинка %s не найдена', image_name)
+        return None
+    images = {'source': image_name}
+    for name, (geometry, options) in DERIVATIVES.items():
+        jpeg = get_thumbnail(
+            image_name, geometry, format='JPEG', quality=JPEG_QUALITY,
+            **options
+        )
+        images[name] = {
+            'jpeg': jpeg.name,
+            'width': jpeg.width,
+            'height': jpeg.height,
+        }
+        if settings.RECIPE_IMAGE_WEBP:
+            images[name]['webp'] = get_thumbnail(
+                image_name, geometry, format='WEBP', quality=WEBP_QUALITY,
+                **options
+            ).name
+    return images
+
+
+def generate(recipe_id, image_name):
+    """
+    Создание копий и запись их в рецепт, если картинка рецепта
+    не сменилась за время обработки.
+    """
+
+    from .models import Recipe
+    from .signals import recipes_changed
+
+    try:
+        images = build(image_name)
+        if images is not None and Recipe.objects.filter(
+            pk=recipe_id, image=image_name
+        ).update(images=images):
+            recipes_changed.send(sender=Recipe, recipe_ids=[recipe_id])
+    except Exception:
+        logger.exception(
+            'Не удалось создать копии картинки %s рецепта %s',
+            image_name, recipe_id
+        )
+
+
+def _generate_in_background(recipe_id, image_name):
+    try:
+        generate(recipe_id, image_name)
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return _executor
+
+
+def _submit(recipe_id, image_name):
+    _get_executor().submit(_generate_in_background, recipe_id, image_name)
+
+
+def schedule(recipe):
+    """
+    Создание копий в фоне после фиксации текущей транзакции.
+    При RECIPE_IMAGE_WORKERS = 0 фоновое создание отключено,
+    копии создаются командой recipeimages.
+    """
+
+    if settings.RECIPE_IMAGE_WORKERS <= 0:
+        return
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: _submit(recipe_id, image_name))
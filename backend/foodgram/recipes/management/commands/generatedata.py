@@ -0,0 +1,111 @@
+import time
+
+from django.core.management import BaseCommand, CommandError, call_command
+from recipes.generator import (BATCH_SIZE, PUBLICATION_DAYS, SKEW,
+                               DataGenerator)
+from recipes.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических пользователей, рецептов, избранного, '
+        'корзин и подписок для нагрузочного тестирования. '
+        'Популярность авторов и рецептов распределена по закону Ципфа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--authors', type=int,
+            help='Сколько пользователей пишут рецепты (по умолчанию 20%%).'
+        )
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--days', type=int, default=PUBLICATION_DAYS,
+            help='За сколько дней распределены даты публикации рецептов.'
+        )
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--min-tags', type=int, default=1)
+        parser.add_argument('--max-tags', type=int, default=3)
+        parser.add_argument(
+            '--favorites', type=float, default=10,
+            help='Среднее количество рецептов в избранном пользователя.'
+        )
+        parser.add_argument(
+            '--cart', type=float, default=3,
+            help='Среднее количество рецептов в корзине пользователя.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='Среднее количество подписок пользователя.'
+        )
+        parser.add_argument('--skew', type=float, default=SKEW)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--prefix', default='user')
+        parser.add_argument(
+            '--password',
+            help='Общий пароль пользователей (по умолчанию вход запрещён).'
+        )
+
+    def progress(self, name, created, seconds):
+        self.stdout.write(
+            f'{name}: {created} строк, '
+            f'{created / max(seconds, 1e-6):.0f} строк/с'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['users'] < 1:
+            raise CommandError('--users и --batch-size должны быть больше 0.')
+        if options['days'] < 0:
+            raise CommandError('--days не может быть отрицательным.')
+        if not (
+            0 <= options['min_ingredients'] <= options['max_ingredients']
+            and 0 <= options['min_tags'] <= options['max_tags']
+        ):
+            raise CommandError('Неверные границы ингредиентов или тегов.')
+        if not Ingredient.objects.exists() or not Tag.objects.exists():
+            call_command('loadpredata', stdout=self.stdout)
+
+        started = time.monotonic()
+        generator = DataGenerator(
+            seed=options['seed'], skew=options['skew'],
+            batch_size=options['batch_size'],
+            progress=self.progress if options['verbosity'] > 1 else None
+        )
+        user_ids = generator.users(
+            options['users'], options['prefix'], options['password']
+        )
+        authors = options['authors']
+        if authors is None:
+            authors = max(1, len(user_ids) // 5)
+        author_ids = user_ids[:authors]
+        recipe_ids = generator.recipes(
+            options['recipes'], author_ids,
+            ingredients=(
+                options['min_ingredients'], options['max_ingredients']
+            ),
+            tags=(options['min_tags'], options['max_tags']),
+            days=options['days']
+        )
+        counts = {
+            'пользователей': len(user_ids),
+            'рецептов': len(recipe_ids),
+            'в избранном': generator.favorites(
+                user_ids, recipe_ids, options['favorites']
+            ),
+            'в корзинах': generator.shopping_cart(
+                user_ids, recipe_ids, options['cart']
+            ),
+            'подписок': generator.subscriptions(
+                user_ids, author_ids, options['subscriptions']
+            ),
+        }
+        generator.finish()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(
+                f'{name} {count}' for name, count in counts.items()
+            ) + f' за {time.monotonic() - started:.1f} с.'
+        ))
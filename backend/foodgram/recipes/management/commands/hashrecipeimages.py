@@ -0,0 +1,58 @@
+import re
+
+from django.core.management import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+from recipes.signals import recipes_changed
+
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{32}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Перенос картинок рецептов в хранилище с именами по хешу '
+        'содержимого: одинаковые файлы сохраняются один раз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Удалить старые файлы, на которые больше нет ссылок.'
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        names = Recipe.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        moved, missing = {}, []
+        for name in names:
+            if HASHED_NAME_RE.search(name):
+                continue
+            if not storage.exists(name):
+                missing.append(name)
+                continue
+            with storage.open(name) as file:
+                moved[name] = storage.save(
+                    field.upload_to + name.split('/')[-1], file
+                )
+
+        for old_name, new_name in moved.items():
+            recipe_ids = list(Recipe.objects.filter(
+                image=old_name
+            ).values_list('id', flat=True))
+            Recipe.objects.filter(id__in=recipe_ids).update(image=new_name)
+            recipes_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+            for recipe_id in recipe_ids:
+                images.generate(recipe_id, new_name)
+            if options['delete']:
+                storage.delete(old_name)
+
+        for name in missing:
+            self.stderr.write(f'Файл не найден: {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {len(moved)}, '
+            f'уникальных: {len(set(moved.values()))}.'
+        ))
@@ -2,27 +2,76 @@ import csv
 import os
 
 from django.conf import settings
-from django.core.management import BaseCommand
-from recipes.models import Ingredient, Tag
+from django.core.management import BaseCommand, CommandError
+from recipes import catalog
 
-MODEL_FILE = {
-    Ingredient: "ingredients.csv",
-    Tag: "tags.csv"
+DATA_DIR = os.path.join(settings.BASE_DIR, 'static/data/')
+
+DEFAULT_FILES = {
+    'ingredients': 'ingredients.csv',
+    'tags': 'tags.csv',
 }
 
 
 class Command(BaseCommand):
-    help = "Загружаем данные из csv-файла в базу данных."
-
-    def handle(self, *args, **kwargs):
-        for model, file in MODEL_FILE.items():
-            with open(
-                os.path.join(settings.BASE_DIR, 'static/data/', file),
-                'r', encoding='utf-8'
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-                model.objects.bulk_create(
-                    model(**data) for data in reader
+    help = (
+        'Загружаем справочники ингредиентов и тегов из файлов '
+        'CSV, JSON или JSON Lines (можно сжатых gzip) в базу данных. '
+        'Уже загруженные строки пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        for name, file in DEFAULT_FILES.items():
+            parser.add_argument(
+                f'--{name}',
+                default=os.path.join(DATA_DIR, file),
+                help=f'Файл справочника {name} (по умолчанию {file}).'
+            )
+        parser.add_argument(
+            '--only',
+            choices=tuple(DEFAULT_FILES),
+            help='Загрузить только один справочник.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=catalog.BATCH_SIZE,
+            help='Количество строк в одной пачке.'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY в PostgreSQL.'
+        )
+
+    def progress(self, name):
+        def report(read, seconds):
+            self.stdout.write(
+                f'{name}: прочитано {read} строк, '
+                f'{read / max(seconds, 1e-6):.0f} строк/с'
+            )
+
+        return report if self.verbosity > 1 else None
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        names = (options['only'], ) if options['only'] else DEFAULT_FILES
+        for name in names:
+            try:
+                read, created, seconds = catalog.load(
+                    name, options[name],
+                    batch_size=options['batch_size'],
+                    use_copy=not options['no_copy'],
+                    progress=self.progress(name)
                 )
+            except (OSError, ValueError, csv.Error) as error:
+                raise CommandError(error)
+            self.stdout.write(
+                f'{name}: прочитано {read}, добавлено {created} '
+                f'за {seconds:.2f} с '
+                f'({read / max(seconds, 1e-6):.0f} строк/с).'
+            )
 
         self.stdout.write(self.style.SUCCESS('Данные успешно загружены!'))
@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка агрегата списков покупок по корзинам и рецептам '
+        'с последующей проверкой.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить агрегат, не пересобирая его.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingListItem.objects.rebuild()
+            self.stdout.write('Списки покупок пересобраны.')
+
+        mismatches = ShoppingListItem.objects.mismatches()
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatches)}. '
+                f'Пользователи: '
+                f'{sorted({user_id for user_id, *_ in mismatches})}'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы.'))
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание уменьшенных копий картинок рецептов, у которых '
+        'копий нет или они построены для другой картинки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        done = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'images'
+        )
+        for recipe in recipes.iterator():
+            if options['all'] or not images.is_current(recipe):
+                images.generate(recipe.pk, recipe.image.name)
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии картинок созданы для {done} рецептов.'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand, CommandError
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка счётчиков избранного и корзины рецептов со строками '
+        'связей и исправление расхождений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить счётчики, не исправляя их.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            fixed = Recipe.objects.reconcile_counters()
+            self.stdout.write(f'Исправлено рецептов: {fixed}.')
+
+        mismatches = list(
+            Recipe.objects.counter_mismatches().values_list('id', flat=True)
+        )
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в счётчиках рецептов: {len(mismatches)}. '
+                f'Рецепты: {sorted(mismatches)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счётчики рецептов согласованы.'))
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Названия ингредиентов рецепта recipe одной строкой ({aggregate}).
+INGREDIENT_NAMES_SQL = (
+    'SELECT {aggregate} FROM recipes_recipeingredient AS link '
+    'JOIN recipes_ingredient AS ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    'WHERE link.recipe_id = recipe.id'
+)
+
+POSTGRES_FORWARD = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING GIN (search_vector)',
+    'UPDATE recipes_recipe AS recipe SET search_vector = '
+    "setweight(to_tsvector('russian'::regconfig, recipe.name), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(({names}), '')), "
+    "'B') || "
+    "setweight(to_tsvector('russian'::regconfig, recipe.text), 'C')".format(
+        names=INGREDIENT_NAMES_SQL.format(
+            aggregate="string_agg(ingredient.name, ' ')"
+        )
+    ),
+)
+
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+    "SELECT recipe.id, recipe.name, coalesce(({names}), ''), recipe.text "
+    'FROM recipes_recipe AS recipe'.format(
+        names=INGREDIENT_NAMES_SQL.format(
+            aggregate="group_concat(ingredient.name, ' ')"
+        )
+    ),
+)
+
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+STATEMENTS = {
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Создание поискового индекса и заполнение его текущими рецептами.
+    SQL записан в миграции, а не берётся из recipes.search, чтобы
+    миграция не менялась вместе с кодом приложения.
+    """
+
+    vendor = schema_editor.connection.vendor
+    for statement in STATEMENTS.get(vendor, ((), ()))[0]:
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in STATEMENTS.get(vendor, ((), ()))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0027_through_model_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('FavoriteRecipe', 'favorites_count'),
+    ('ShoppingCartRecipe', 'shopping_cart_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполнение счётчиков по существующим связям."""
+
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(**{
+        field: Coalesce(models.Subquery(
+            apps.get_model('recipes', model).objects.filter(
+                recipe=models.OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=models.Count('id')
+            ).values('total')
+        ), 0) for model, field in COUNTERS
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0031_recipe_author_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', 'id'], name='recipe_popular_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Coalesce, RowNumber
 from users.models import User
 
+from .storage import recipe_image_storage
+
 
 class Tag(models.Model):
 
@@ -46,6 +49,103 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для модели Recipe."""
+
+    def with_related(self):
+        """
+        Подгрузка автора, тегов и ингредиентов рецептов.
+        Количество запросов не зависит от количества рецептов
+        и ингредиентов.
+        """
+
+        return self.prefetch_related(
+            'author',
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            ),
+            'tags'
+        )
+
+    def latest_per_author(self, author_ids, limit):
+        """
+        Не более limit последних рецептов каждого из авторов author_ids.
+        Номер рецепта у автора вычисляется оконной функцией
+        ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC)
+        во вложенном запросе, поэтому рецепты всех авторов выбираются
+        одним запросом.
+        """
+
+        if not author_ids:
+            return self.none()
+        ranked = self.model.objects.filter(
+            author_id__in=author_ids
+        ).annotate(
+            author_position=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[models.F('pub_date').desc(), models.F('id').desc()]
+            )
+        ).order_by().values('id', 'author_position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=models.expressions.RawSQL(
+            f'SELECT ranked.id FROM ({sql}) AS ranked '
+            'WHERE ranked.author_position <= %s',
+            (*params, limit)
+        )).order_by('-pub_date', '-id')
+
+    def shift_counter(self, field, recipe_ids, delta):
+        """Атомарное изменение счётчика рецептов на delta (F-выражение)."""
+
+        return self.filter(id__in=recipe_ids).update(
+            **{field: models.F(field) + delta}
+        )
+
+    def expected_counter(self, model):
+        """Количество строк связи model у рецепта (подзапрос)."""
+
+        return Coalesce(models.Subquery(
+            model.objects.filter(
+                recipe=models.OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=models.Count('id')
+            ).values('total')
+        ), 0)
+
+    def counter_mismatches(self):
+        """Рецепты, счётчики которых расходятся со строками связей."""
+
+        condition = models.Q()
+        for model in (FavoriteRecipe, ShoppingCartRecipe):
+            field = model.counter_field
+            condition |= ~models.Q(**{field: models.F(f'expected_{field}')})
+        return self.annotate(**{
+            f'expected_{model.counter_field}': self.expected_counter(model)
+            for model in (FavoriteRecipe, ShoppingCartRecipe)
+        }).filter(condition)
+
+    def reconcile_counters(self, batch_size=1000):
+        """
+        Пересчёт счётчиков избранного и корзины рецептов с расхождениями.
+        Возвращает количество исправленных рецептов.
+        """
+
+        recipe_ids = list(
+            self.counter_mismatches().values_list('id', flat=True)
+        )
+        for start in range(0, len(recipe_ids), batch_size):
+            self.model.objects.filter(
+                id__in=recipe_ids[start:start + batch_size]
+            ).update(**{
+                model.counter_field: self.expected_counter(model)
+                for model in (FavoriteRecipe, ShoppingCartRecipe)
+            })
+        return len(recipe_ids)
+
+
 class Recipe(models.Model):
     name = models.CharField(
         verbose_name='Название',
@@ -56,7 +156,8 @@ class Recipe(models.Model):
         User,
         verbose_name='Автор рецепта',
         on_delete=models.CASCADE,
-        related_name='recipes'
+        related_name='recipes',
+        db_index=False
     )
     text = models.TextField(
         verbose_name='Описание',
@@ -65,6 +166,13 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='recipes/images/',
+        storage=recipe_image_storage
+    )
+    images = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False
     )
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -96,11 +204,37 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', )
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=['-pub_date', 'id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', 'id'],
+                name='recipe_popular_idx'
+            )
+        ]
 
     def __str__(self) -> str:
         return str(self.name)
@@ -109,8 +243,16 @@ class Recipe(models.Model):
 class RecipeIngredient(models.Model):
     """Вспомогательная модель для связи моделей Recipe и Ingredient."""
 
-    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False
+    )
     amount = models.PositiveIntegerField(
         verbose_name='Количество',
         null=True,
@@ -124,7 +266,12 @@ class RecipeIngredient(models.Model):
                 name='unique_ingredient_recipe'
             )
         ]
-        ordering = ('-recipe__pub_date', )
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                name='recipe_ingredient_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.ingredient} в рецепте {self.recipe}'
@@ -133,8 +280,12 @@ class RecipeIngredient(models.Model):
 class RecipeTag(models.Model):
     """Вспомогательная модель для связи моделей Recipe и Tag."""
 
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False
+    )
 
     class Meta:
         constraints = [
@@ -143,19 +294,86 @@ class RecipeTag(models.Model):
                 name='unique_tag_recipe'
             )
         ]
-        ordering = ('-recipe__pub_date', )
+        indexes = [
+            models.Index(fields=['recipe', 'tag'], name='recipe_tag_idx')
+        ]
 
     def __str__(self):
         return f'{self.recipe} с тэгом {self.tag}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """
+    Связи пользователей с рецептами (избранное, корзина).
+    Количество связей рецепта хранится в поле рецепта counter_field:
+    созданные через save() строки учитываются сигналом post_save,
+    add_recipes и remove_recipes - одним UPDATE по реально изменённым
+    строкам, каскадное удаление с пользователем - сигналом pre_delete
+    пользователя (обработчика post_delete нет, чтобы каскад удалял
+    связи одним запросом).
+    Изменения связей одного пользователя выполняются по очереди:
+    add_recipes и remove_recipes вызываются в транзакции после
+    lock_user, иначе параллельные запросы учли бы рецепт дважды.
+    """
+
+    def lock_user(self, user):
+        """Блокировка строки пользователя до конца транзакции."""
+
+        list(User.objects.select_for_update().filter(
+            pk=user.pk
+        ).values_list('pk', flat=True))
+
+    def linked(self, user, recipe_ids):
+        """id рецептов из recipe_ids, уже связанных с пользователем."""
+
+        return set(self.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+
+    def add_recipes(self, user, recipe_ids):
+        """
+        Добавление пользователю рецептов, которых у него ещё нет.
+        Возвращает id добавленных рецептов.
+        """
+
+        linked = self.linked(user, recipe_ids)
+        added = [pk for pk in dict.fromkeys(recipe_ids) if pk not in linked]
+        if added:
+            self.bulk_create(
+                [self.model(user=user, recipe_id=pk) for pk in added]
+            )
+            Recipe.objects.shift_counter(
+                self.model.counter_field, added, 1
+            )
+        return added
+
+    def remove_recipes(self, user, recipe_ids):
+        """
+        Удаление у пользователя рецептов, которые у него есть.
+        У моделей связей нет сигналов удаления и зависимых строк,
+        поэтому delete() выполняет один DELETE без загрузки строк.
+        Возвращает id удалённых рецептов.
+        """
+
+        removed = list(self.linked(user, recipe_ids))
+        if removed:
+            self.filter(user=user, recipe_id__in=removed).delete()
+            Recipe.objects.shift_counter(
+                self.model.counter_field, removed, -1
+            )
+        return removed
+
+
 class FavoriteRecipe(models.Model):
     """
     Вспомогательная модель для связи моделей Recipe и User
     (пользователь, который добавил рецепт в избранное).
     """
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Поле рецепта со счётчиком связей.
+    counter_field = 'favorites_count'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
 
     class Meta:
@@ -165,7 +383,8 @@ class FavoriteRecipe(models.Model):
                 name='unique_favorite_recipe'
             )
         ]
-        ordering = ('-recipe__pub_date', )
+
+    objects = UserRecipeQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f'{self.recipe} в избранном у {self.user}'
@@ -177,7 +396,10 @@ class ShoppingCartRecipe(models.Model):
     (пользователь, который добавил рецепт в корзину).
     """
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Поле рецепта со счётчиком связей.
+    counter_field = 'shopping_cart_count'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
 
     class Meta:
@@ -187,12 +409,203 @@ class ShoppingCartRecipe(models.Model):
                 name='unique_recipe_in_cart'
             )
         ]
-        ordering = ('-recipe__pub_date', )
+
+    objects = UserRecipeQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f'{self.recipe} в списке покупок у {self.user}'
 
 
+class ShoppingListItemQuerySet(models.QuerySet):
+    """
+    Поддержка агрегата ShoppingListItem. Методы вызываются в той же
+    транзакции, что и изменение корзины или ингредиентов рецепта.
+    """
+
+    def expected(self):
+        """Суммы ингредиентов, вычисленные по корзинам и рецептам."""
+
+        return RecipeIngredient.objects.filter(
+            recipe__shoppingcartrecipe__isnull=False
+        ).values(
+            'ingredient_id',
+            user_id=models.F('recipe__shoppingcartrecipe__user_id')
+        ).annotate(
+            total_amount=Coalesce(
+                models.Sum('amount'), 0
+            ),
+            total_recipes=models.Count('id')
+        ).order_by()
+
+    def rebuild(self):
+        """Полная пересборка агрегата по корзинам и рецептам."""
+
+        self.all().delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=row['user_id'],
+                    ingredient_id=row['ingredient_id'],
+                    amount=row['total_amount'],
+                    recipes_count=row['total_recipes']
+                ) for row in self.expected().iterator()
+            ),
+            batch_size=1000
+        )
+
+    def mismatches(self):
+        """Строки агрегата, расходящиеся с корзинами и рецептами."""
+
+        actual = set(self.values_list(
+            'user_id', 'ingredient_id', 'amount', 'recipes_count'
+        ).order_by().iterator())
+        expected = set(self.expected().values_list(
+            'user_id', 'ingredient_id', 'total_amount', 'total_recipes'
+        ).iterator())
+        return actual ^ expected
+
+    def add_recipes(self, user, recipe_ids):
+        """Учёт рецептов, добавленных в корзину пользователя."""
+
+        self._shift([user.id], self._recipe_deltas(recipe_ids, 1))
+
+    def remove_recipes(self, user, recipe_ids):
+        """Учёт рецептов, удалённых из корзины пользователя."""
+
+        self._shift([user.id], self._recipe_deltas(recipe_ids, -1))
+
+    def change_recipe(self, recipe, before, after):
+        """
+        Учёт изменения ингредиентов рецепта во всех корзинах с ним.
+        before и after - словари {id ингредиента: количество}.
+        """
+
+        deltas = {}
+        for ingredient_id in before.keys() | after.keys():
+            delta = (
+                (after.get(ingredient_id) or 0)
+                - (before.get(ingredient_id) or 0),
+                (ingredient_id in after) - (ingredient_id in before)
+            )
+            if delta != (0, 0):
+                deltas[ingredient_id] = delta
+        self._shift(self._lock_cart_users(recipe), deltas)
+
+    def remove_recipe(self, recipe):
+        """Вычет рецепта из всех корзин с ним (перед удалением рецепта)."""
+
+        self._shift(
+            self._lock_cart_users(recipe),
+            self._recipe_deltas([recipe.id], -1)
+        )
+
+    def _lock_cart_users(self, recipe):
+        """
+        Блокировка до конца транзакции пользователей, у которых рецепт
+        в корзине: их суммы меняются так же, как под lock_user при
+        изменении корзины. Строки блокируются по возрастанию id, чтобы
+        параллельные правки рецептов не взаимоблокировались.
+        Возвращает id пользователей подзапросом (без длинного IN).
+        """
+
+        user_ids = ShoppingCartRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        return user_ids
+
+    def _recipe_deltas(self, recipe_ids, sign):
+        return {
+            row['ingredient_id']: (
+                sign * (row['total_amount'] or 0), sign * row['total_recipes']
+            ) for row in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id').annotate(
+                total_amount=models.Sum('amount'),
+                total_recipes=models.Count('id')
+            ).order_by()
+        }
+
+    def _shift(self, user_ids, deltas):
+        """
+        Изменение сумм и счётчиков рецептов для пар (пользователь,
+        ингредиент) фиксированным количеством запросов.
+        Строки без рецептов удаляются.
+        """
+
+        if not deltas:
+            return
+        created = [
+            ingredient_id for ingredient_id, (_, count) in deltas.items()
+            if count > 0
+        ]
+        if created:
+            self.bulk_create(
+                (
+                    self.model(user_id=user_id, ingredient_id=ingredient_id)
+                    for user_id in user_ids for ingredient_id in created
+                ),
+                ignore_conflicts=True
+            )
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        rows.update(
+            amount=models.F('amount') + self._case(deltas, 0),
+            recipes_count=models.F('recipes_count') + self._case(deltas, 1)
+        )
+        rows.filter(recipes_count__lte=0).delete()
+
+    def _case(self, deltas, position):
+        return models.Case(
+            *(
+                models.When(
+                    ingredient_id=ingredient_id,
+                    then=models.Value(delta[position])
+                ) for ingredient_id, delta in deltas.items()
+            ),
+            default=models.Value(0),
+            output_field=models.IntegerField()
+        )
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя.
+    Готовый список покупок, обновляется вместе с корзиной
+    и ингредиентами рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        db_index=False
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} в списке покупок у {self.user}'
+
+
 class Subscription(models.Model):
     """Модель для подписок."""
     user = models.ForeignKey(
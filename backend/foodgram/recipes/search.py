@@ -0,0 +1,196 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+PostgreSQL: столбец recipes_recipe.search_vector (tsvector) с GIN-индексом.
+SQLite: виртуальная таблица FTS5 recipes_recipe_fts (rowid = id рецепта).
+Для остальных СУБД поиск не поддерживается (supported() == False).
+
+Поисковый документ пересчитывается явно: index_recipes() после изменения
+рецепта или его ингредиентов, remove_recipes() при удалении рецепта.
+"""
+import re
+
+from django.db import connections, models, router
+
+RECIPE_TABLE = 'recipes_recipe'
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+SEARCH_CONFIG = 'russian'
+
+BATCH_SIZE = 500
+
+TERM_RE = re.compile(r'\w+')
+
+INGREDIENT_NAMES_SQL = (
+    'SELECT {aggregate} FROM recipes_recipeingredient AS link '
+    'JOIN recipes_ingredient AS ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    'WHERE link.recipe_id = recipe.id'
+)
+
+
+class PostgresSearchBackend:
+    """Поиск по tsvector: название (A), ингредиенты (B), описание (C)."""
+
+    update_sql = (
+        'UPDATE recipes_recipe AS recipe SET search_vector = '
+        "setweight(to_tsvector(%s::regconfig, recipe.name), 'A') || "
+        'setweight(to_tsvector(%s::regconfig, coalesce(({names}), \'\')), '
+        "'B') || "
+        "setweight(to_tsvector(%s::regconfig, recipe.text), 'C')"
+    ).format(names=INGREDIENT_NAMES_SQL.format(
+        aggregate="string_agg(ingredient.name, ' ')"
+    ))
+
+    def index(self, cursor, recipe_ids=None):
+        params = [SEARCH_CONFIG] * 3
+        if recipe_ids is None:
+            cursor.execute(self.update_sql, params)
+            return
+        cursor.execute(
+            self.update_sql + ' WHERE recipe.id = ANY(%s)',
+            params + [list(recipe_ids)]
+        )
+
+    def remove(self, cursor, recipe_ids):
+        """Документ удаляется вместе со строкой рецепта."""
+
+    def search(self, queryset, terms):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        tsquery = 'to_tsquery(%s::regconfig, %s)'
+        return queryset.filter(models.expressions.RawSQL(
+            f'{RECIPE_TABLE}.search_vector @@ {tsquery}',
+            (SEARCH_CONFIG, query),
+            output_field=models.BooleanField()
+        )).annotate(search_rank=models.expressions.RawSQL(
+            f'ts_rank({RECIPE_TABLE}.search_vector, {tsquery})',
+            (SEARCH_CONFIG, query),
+            output_field=models.FloatField()
+        ))
+
+
+class SqliteSearchBackend:
+    """Поиск по FTS5 с ранжированием bm25 (веса 10/5/1)."""
+
+    insert_sql = (
+        f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+        'SELECT recipe.id, recipe.name, coalesce(({names}), \'\'), '
+        'recipe.text FROM recipes_recipe AS recipe'
+    ).format(names=INGREDIENT_NAMES_SQL.format(
+        aggregate="group_concat(ingredient.name, ' ')"
+    ))
+
+    def index(self, cursor, recipe_ids=None):
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(self.insert_sql)
+            return
+        for batch in _batches(recipe_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            self.remove(cursor, batch)
+            cursor.execute(
+                f'{self.insert_sql} WHERE recipe.id IN ({placeholders})',
+                batch
+            )
+
+    def remove(self, cursor, recipe_ids):
+        for batch in _batches(recipe_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                batch
+            )
+
+    def search(self, queryset, terms):
+        """
+        Соединение с таблицей FTS5: MATCH и bm25 вычисляются
+        один раз для каждого найденного документа.
+        """
+
+        query = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            select={
+                'search_rank': f'-bm25({FTS_TABLE}, 10.0, 5.0, 1.0)'
+            },
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE} MATCH %s',
+                f'{FTS_TABLE}.rowid = {RECIPE_TABLE}.id'
+            ],
+            params=[query]
+        )
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend(),
+    'sqlite': SqliteSearchBackend(),
+}
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _connection(write=False):
+    from .models import Recipe
+
+    if write:
+        return connections[router.db_for_write(Recipe)]
+    return connections[router.db_for_read(Recipe)]
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor)
+
+
+def supported(connection=None):
+    return get_backend(connection or _connection()) is not None
+
+
+def get_terms(query):
+    """Слова поискового запроса без служебных символов."""
+
+    return TERM_RE.findall(query.lower())
+
+
+def index_recipes(recipe_ids=None):
+    """
+    Пересчёт поисковых документов рецептов.
+    Без recipe_ids перестраивается индекс всех рецептов.
+    """
+
+    connection = _connection(write=True)
+    backend = get_backend(connection)
+    if backend is None or recipe_ids is not None and not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        backend.index(cursor, recipe_ids)
+
+
+def remove_recipes(recipe_ids):
+    """Удаление поисковых документов рецептов."""
+
+    connection = _connection(write=True)
+    backend = get_backend(connection)
+    if backend is None or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, recipe_ids)
+
+
+def search(queryset, query):
+    """
+    Рецепты, подходящие под запрос (каждое слово как префикс),
+    в порядке убывания релевантности (аннотация search_rank).
+    """
+
+    terms = get_terms(query)
+    if not terms:
+        return queryset.none()
+    backend = get_backend(connections[queryset.db])
+    return backend.search(queryset, terms).order_by(
+        '-search_rank', '-pub_date', 'id'
+    )
@@ -0,0 +1,88 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import images, search
+from users.models import User
+
+from .models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCartRecipe,
+                     ShoppingListItem)
+
+# Рецепты изменены в обход save() (queryset.update), аргумент recipe_ids.
+recipes_changed = Signal()
+
+# Справочник (sender - модель) загружен в обход save() (bulk_create, COPY).
+catalog_loaded = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_recipe_images(sender, instance, **kwargs):
+    """Создание уменьшенных копий новой картинки рецепта."""
+
+    if instance.image and not images.is_current(instance):
+        images.schedule(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """
+    Вычет рецепта из списков покупок. pre_delete отправляется при любом
+    удалении рецепта, в том числе каскадном и через queryset.delete().
+    """
+
+    ShoppingListItem.objects.remove_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search(sender, instance, **kwargs):
+    """Удаление поискового документа рецепта."""
+
+    search.remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    """Переименование ингредиента меняет документы рецептов с ним."""
+
+    if not created:
+        search.index_recipes(instance.recipeingredient_set.values_list(
+            'recipe_id', flat=True
+        ))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def collect_ingredient_recipes(sender, instance, **kwargs):
+    instance.search_recipe_ids = list(
+        instance.recipeingredient_set.values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def reindex_ingredient_recipes_after_delete(sender, instance, **kwargs):
+    search.index_recipes(getattr(instance, 'search_recipe_ids', ()))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+def count_user_recipe(sender, instance, created, **kwargs):
+    """Увеличение счётчика избранного или корзины рецепта."""
+
+    if created:
+        Recipe.objects.shift_counter(
+            sender.counter_field, [instance.recipe_id], 1
+        )
+
+
+@receiver(pre_delete, sender=User)
+def uncount_user_recipes(sender, instance, **kwargs):
+    """
+    Избранное и корзина пользователя удаляются каскадом одним DELETE
+    без сигналов (быстрое удаление), поэтому счётчики рецептов
+    уменьшаются заранее - одним UPDATE на модель связи.
+    """
+
+    for model in (FavoriteRecipe, ShoppingCartRecipe):
+        Recipe.objects.shift_counter(
+            model.counter_field,
+            model.objects.filter(user=instance).values('recipe_id'),
+            -1
+        )
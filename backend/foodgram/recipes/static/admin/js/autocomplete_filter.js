@@ -0,0 +1,17 @@
+'use strict';
+{
+    // Переход к списку с выбранным в фильтре значением.
+    const $ = django.jQuery;
+    $(function() {
+        $('select.autocomplete-filter').on('change', function() {
+            const url = new URL(window.location.href);
+            url.searchParams.delete('p');
+            if (this.value) {
+                url.searchParams.set(this.name, this.value);
+            } else {
+                url.searchParams.delete(this.name);
+            }
+            window.location.href = url.toString();
+        });
+    });
+}
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_LENGTH = 32
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - хеш его содержимого:
+    <каталог>/<2 символа хеша>/<хеш><расширение>.
+    Одинаковые файлы хранятся один раз, а файл с заданным именем
+    никогда не меняется, поэтому его можно кэшировать бессрочно.
+    """
+
+    def hashed_name(self, name, content):
+        """Имя файла в хранилище по содержимому content."""
+
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        key = digest.hexdigest()[:HASH_LENGTH]
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, key[:2], key + extension)
+
+    def is_same(self, name, content):
+        """Файл name уже содержит content."""
+
+        return bool(name) and (
+            posixpath.basename(self.hashed_name(name, content))
+            == posixpath.basename(name)
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+recipe_image_storage = ContentHashStorage()
@@ -1,15 +1,48 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.admin_tools import (LargeTableAdminMixin, chunked_action,
+                                 delete_in_chunks)
+from recipes.models import Recipe
 
 from .models import User
 
 
+@chunked_action('Деактивировать выбранных', permissions=['change'])
+def deactivate_users(modeladmin, request, queryset):
+    return queryset.update(is_active=False)
+
+
 @admin.register(User)
-class UserAdmin(UserAdmin):
+class UserAdmin(LargeTableAdminMixin, UserAdmin):
+    """
+    Пользователи: поиск по началу username и email, фильтры только
+    по флагам, количество рецептов - подзапросом для строк страницы.
+    """
+
     list_display = (
         'id',
         'username',
         'email',
-        'password',
+        'is_active',
+        'recipes_count',
     )
-    list_filter = ('email', 'username')
+    list_filter = ('is_active', 'is_staff')
+    search_fields = ('^username', '^email')
+    actions = (delete_in_chunks, deactivate_users)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=Coalesce(Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('pk')
+                ).order_by().values('author').annotate(
+                    total=Count('id')
+                ).values('total')
+            ), 0)
+        )
+
+    @admin.display(description='Рецептов', ordering='recipes_count')
+    def recipes_count(self, obj):
+        return obj.recipes_count
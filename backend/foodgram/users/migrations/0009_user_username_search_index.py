@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Индекс для поиска пользователей по началу username без учёта регистра
+# (istartswith: UPPER(username::text) LIKE UPPER('...%')).
+POSTGRES_FORWARD = (
+    'CREATE INDEX users_user_username_upper_like_idx ON users_user '
+    '(UPPER(username::text) text_pattern_ops)',
+)
+
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS users_user_username_upper_like_idx',
+)
+
+STATEMENTS = {
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in STATEMENTS.get(vendor, ((), ()))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in STATEMENTS.get(vendor, ((), ()))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_alter_user_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
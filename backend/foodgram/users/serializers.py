@@ -1,3 +1,4 @@
+from api import relations
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from users.models import User
@@ -22,8 +23,9 @@ class UserSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         """Вычисление поля is_subscribed."""
 
-        return obj.subscriptions.filter(
-            user__id=self.context.get('request').user.id).exists()
+        return relations.is_related(
+            self.context, relations.SUBSCRIPTIONS, obj.id
+        )
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
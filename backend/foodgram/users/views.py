@@ -1,14 +1,20 @@
-from api.filters import RecipeFilter
-from api.pagination import StandardResultsSetPagination
+from api import relations
+from api.pagination import RECIPES_PER_PAGE, StandardResultsSetPagination
 from api.permissions import SubscriptionOwnerPermission
 from api.serializers import SubscriptionSerializer
-from django.db.models import Count
+from django.db.models import Count, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from djoser.compat import get_user_email
+from djoser.conf import settings as djoser_settings
 from djoser.views import UserViewSet
 from foodgram import settings
-from recipes.models import Subscription
+from recipes.models import Recipe, Subscription
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from rest_framework.pagination import _positive_int
 from rest_framework.response import Response
 
 from .models import User
@@ -16,28 +22,40 @@ from .serializers import CustomUserCreateSerializer, UserSerializer
 
 logger = settings.logging.getLogger(__name__)
 
+MAX_RECIPES_LIMIT = 100
+
+# Действия djoser для анонимных пользователей (регистрация, активация,
+# сброс пароля и логина): права берутся из настроек djoser.
+ANONYMOUS_ACTIONS = (
+    'create', 'activation', 'resend_activation', 'reset_password',
+    'reset_password_confirm', 'reset_username', 'reset_username_confirm',
+)
+
 
 class CustomUserSubscriptionViewSet(UserViewSet):
     """
     Переопределение вьюсета из библиотеки Joser:
     Операции с пользователями.
+    Поиск в списке по началу username (параметр search),
+    пагинация по ключу id при наличии параметра cursor.
     Дополнительные действия с подписками (@action).
     """
 
     serializer_class = UserSerializer
     queryset = User.objects.all()
     pagination_class = StandardResultsSetPagination
-    filterset_class = RecipeFilter
+    cursor_ordering = ('id', )
+    filter_backends = (SearchFilter, )
+    search_fields = ('^username', )
 
     def get_permissions(self):
         """Определение условий для применения пермишенов."""
 
-        return (
-            (SubscriptionOwnerPermission(), ) if 'subscriptions'
-            in self.request.path else (
-                permissions.IsAuthenticatedOrReadOnly(),
-            )
-        )
+        if 'subscriptions' in self.request.path:
+            return (SubscriptionOwnerPermission(), )
+        if self.action in ANONYMOUS_ACTIONS:
+            return super().get_permissions()
+        return (permissions.IsAuthenticatedOrReadOnly(), )
 
     def get_serializer_class(self):
         """
@@ -49,6 +67,43 @@ class CustomUserSubscriptionViewSet(UserViewSet):
             else super().get_serializer_class()
         )
 
+    def get_recipes_limit(self):
+        """
+        Количество рецептов автора в подписке (параметр recipes_limit):
+        целое число от 1 до MAX_RECIPES_LIMIT.
+        """
+
+        value = self.request.query_params.get('recipes_limit')
+        if value is None:
+            return RECIPES_PER_PAGE
+        try:
+            return _positive_int(
+                value, strict=True, cutoff=MAX_RECIPES_LIMIT
+            )
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': 'Должно быть целым числом больше нуля.'}
+            )
+
+    def get_subscription_data(self, authors, recipes_limit):
+        """
+        Сериализованные авторы вместе с их последними рецептами.
+        Рецепты всех авторов загружаются одним запросом.
+        """
+
+        prefetch_related_objects(authors, Prefetch(
+            'recipes',
+            queryset=Recipe.objects.latest_per_author(
+                [author.id for author in authors], recipes_limit
+            ),
+            to_attr='latest_recipes'
+        ))
+        return SubscriptionSerializer(
+            authors,
+            context={'request': self.request},
+            many=True
+        ).data
+
     @action(["get"], detail=False)
     def me(self, request):
         """Получение текущего пользователя."""
@@ -64,6 +119,40 @@ class CustomUserSubscriptionViewSet(UserViewSet):
             status=status.HTTP_200_OK
         )
 
+    @action(['post'], detail=False)
+    def set_username(self, request, *args, **kwargs):
+        """Смена логина (поле LOGIN_FIELD djoser) текущего пользователя."""
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.change_login(request.user, serializer)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(['post'], detail=False)
+    def reset_username_confirm(self, request, *args, **kwargs):
+        """Смена логина по ссылке из письма сброса."""
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.user.last_login = timezone.now()
+        self.change_login(serializer.user, serializer)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def change_login(self, user, serializer):
+        """
+        Сохранение нового логина (поле new_<LOGIN_FIELD> запроса).
+        djoser 2.1 читает значение из new_<USERNAME_FIELD>, которого
+        при LOGIN_FIELD = email в сериализаторе нет, и отвечал 500.
+        """
+
+        login_field = djoser_settings.LOGIN_FIELD
+        setattr(user, login_field, serializer.validated_data[login_field])
+        user.save()
+        if djoser_settings.USERNAME_CHANGED_EMAIL_CONFIRMATION:
+            djoser_settings.EMAIL.username_changed_confirmation(
+                self.request, {'user': user}
+            ).send([get_user_email(user)])
+
     @action(methods=['post', 'delete'], detail=True)
     def subscribe(self, request, id):
         """Подписка (POST) и отписка (DELETE) от авторов рецептов."""
@@ -79,11 +168,14 @@ class CustomUserSubscriptionViewSet(UserViewSet):
             author=author
         )
         if request.method == 'DELETE':
-            subscription.delete()
+            deleted, _ = subscription.delete()
+            if deleted:
+                relations.invalidate(request.user.id)
             return Response(
                 f'Вы отписались от автора {author}',
                 status=status.HTTP_204_NO_CONTENT
             )
+        recipes_limit = self.get_recipes_limit()
         if subscription.exists():
             return Response(
                 'Вы уже подписаны на этого автора',
@@ -94,16 +186,11 @@ class CustomUserSubscriptionViewSet(UserViewSet):
             author=author
         )
 
-        serializer = SubscriptionSerializer(
-            User.objects.filter(
-                subscriptions__author__id=author.id
-            ).annotate(recipes_count=Count('recipes__id')).get(
-                subscriptions__user__id=request.user.id
-            ),
-            context={'request': request}
-        )
+        author = User.objects.annotate(
+            recipes_count=Count('recipes')
+        ).get(id=author.id)
         return Response(
-            serializer.data,
+            self.get_subscription_data([author], recipes_limit)[0],
             status=status.HTTP_200_OK
         )
 
@@ -111,23 +198,18 @@ class CustomUserSubscriptionViewSet(UserViewSet):
     def subscriptions(self, request):
         """Получение списка подписок текущего пользователя."""
 
+        recipes_limit = self.get_recipes_limit()
         subscriptions = User.objects.filter(
             subscriptions__user__id=request.user.id
-        ).annotate(recipes_count=Count('recipes'))
+        ).annotate(recipes_count=Count('recipes')).order_by('id')
 
         page = self.paginate_queryset(subscriptions)
         if page is not None:
-            serializer = SubscriptionSerializer(
-                page,
-                context={'request': request},
-                many=True
-            )
             return self.get_paginated_response(
-                serializer.data
+                self.get_subscription_data(page, recipes_limit)
             )
-        serializer = self.get_serializer(subscriptions, many=True)
 
         return Response(
-            serializer.data,
+            self.get_subscription_data(list(subscriptions), recipes_limit),
             status=status.HTTP_200_OK
         )